@@ -0,0 +1,208 @@
+"""
+爬虫基准测试：对着本地 fixture_server 跑 buff_scraper / youpin_scraper，不访问真实站点。
+
+输出每个市场每一轮的 件/秒、单件耗时 P50/P95、浏览器+本进程内存峰值。
+每次改爬虫性能相关代码前后各跑一次，对比同样参数下的数字。
+
+用法:
+    python bench_scrapers.py                              # 两个市场各 2 轮，无头自带 Chromium
+    python bench_scrapers.py --markets buff --buff-mode browser --latency-ms 80
+    python bench_scrapers.py --fail-rate 0.1 --rounds 3 --json bench.json
+    python bench_scrapers.py --fail-rate 0.2 --fail-status 429   # 观察限流退避
+    python bench_scrapers.py --headed --channel msedge    # 有头 Edge，和线上一致
+
+浏览器需要 `playwright install chromium` (或本机已装的 Edge，用 --channel msedge)。
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 在临时目录里跑：商品缓存 / 价格库 / 导出文件都不碰工作目录
+COPY_FILES = ("task.xlsx", "recipes.json")
+# 假登录文件 (storage_state)：让登录预检通过，假服务器本身不校验 cookie
+FAKE_AUTH = {"buff_auth.json": (".buff.163.com", "session"), "uu_auth.json": (".youpin898.com", "uu_token")}
+
+
+def write_fake_auth(workdir):
+    for filename, (domain, name) in FAKE_AUTH.items():
+        state = {"cookies": [{"name": name, "value": "bench", "domain": domain, "path": "/",
+                              "expires": -1, "httpOnly": True, "secure": False, "sameSite": "Lax"}],
+                 "origins": []}
+        with open(os.path.join(workdir, filename), "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+
+class RssSampler:
+    """后台线程定时采样本进程 + 子进程 (浏览器) 的内存，记录峰值；无 psutil 时不采样"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        import psutil
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        mb = total / 1024 / 1024
+        self.peak_mb = mb if self.peak_mb is None else max(self.peak_mb, mb)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._sample()
+            except Exception:
+                pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        try:
+            import psutil  # noqa: F401
+        except ImportError:
+            return self
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread: self._thread.join()
+
+
+def reset_guards():
+    """熔断器 / 限速器是进程内单例：每轮从头开始，上一轮 (或上一个市场) 打开的熔断不会让本轮直接跳过而虚高吞吐"""
+    import rate_limiter
+    import resilience
+    with resilience._guards_lock:
+        resilience._guards.clear()
+    with rate_limiter._limiters_lock:
+        rate_limiter._limiters.clear()
+
+
+def run_market(market, module, rounds):
+    import metrics
+
+    results = []
+    for r in range(1, rounds + 1):
+        reset_guards()
+        m = metrics.get_metrics()
+        m.reset_cycle()
+        with RssSampler() as rss:
+            t0 = time.perf_counter()
+            snapshot = module.run_scraper()
+            elapsed = time.perf_counter() - t0
+
+        items = len(snapshot.items) if snapshot else 0
+        # 吞吐只算真正抓到的：熔断跳过 / 失败 (stale) 的不算
+        scraped = sum(1 for n in snapshot.items
+                      if n not in snapshot.stale and snapshot.stats.get(n) is not None) if snapshot else 0
+        ok = sum(1 for s in (snapshot.stats.values() if snapshot else []) if s and s.get("最低"))
+        summary = m.cycle_summary()
+        item_stats = summary["stages"].get(f"item[{market}]", {})
+        results.append({
+            "market": market,
+            "round": r,
+            "items": items,
+            "scraped": scraped,
+            "ok": ok,
+            "seconds": round(elapsed, 3),
+            "items_per_sec": round(scraped / elapsed, 2) if elapsed else None,
+            "p50": item_stats.get("p50"),
+            "p95": item_stats.get("p95"),
+            "peak_rss_mb": round(rss.peak_mb, 1) if rss.peak_mb else None,
+            "events": summary["events"],
+        })
+    return results
+
+
+def print_table(rows):
+    print("\n" + "=" * 84)
+    print(f"{'市场':<8}{'轮次':>4}{'件数':>6}{'抓到':>6}{'有价':>6}{'耗时(s)':>10}{'件/秒':>8}"
+          f"{'P50(s)':>9}{'P95(s)':>9}{'峰值RSS(MB)':>14}")
+    for r in rows:
+        fmt = lambda v: "-" if v is None else v
+        print(f"{r['market']:<8}{r['round']:>4}{r['items']:>6}{r['scraped']:>6}{r['ok']:>6}{r['seconds']:>10}"
+              f"{fmt(r['items_per_sec']):>8}{fmt(r['p50']):>9}{fmt(r['p95']):>9}{fmt(r['peak_rss_mb']):>14}")
+        if r["events"]:
+            print(f"{'':<12}事件: {r['events']}")
+    print("=" * 84)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫离线基准测试")
+    parser.add_argument("--markets", default="buff,uu", help="buff / uu / buff,uu")
+    parser.add_argument("--rounds", type=int, default=2, help="每个市场跑几轮 (第 1 轮冷启动，之后走缓存)")
+    parser.add_argument("--buff-mode", choices=["api", "browser"], default="api",
+                        help="BUFF 走直连接口还是浏览器拦截")
+    parser.add_argument("--uu-mode", choices=["api", "dom"], default="api",
+                        help="悠悠优先截获接口 JSON 还是读表格")
+    parser.add_argument("--no-delta", action="store_true", help="关闭 BUFF 第一页指纹缓存")
+    parser.add_argument("--pages", type=int, default=3, help="假服务器每件的在售页数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的额外延迟")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="接口随机失败的比例")
+    parser.add_argument("--fail-status", type=int, default=503, help="失败时的状态码 (429 测试限流退避)")
+    parser.add_argument("--channel", default="", help="浏览器渠道 (空 = Playwright 自带 Chromium)")
+    parser.add_argument("--headed", action="store_true", help="有头模式 (默认无头)")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    import fixture_server
+    server, base_url = fixture_server.start_in_thread(
+        port=0, total_pages=args.pages, latency_ms=args.latency_ms,
+        fail_rate=args.fail_rate, fail_status=args.fail_status)
+
+    # 这些都在模块导入时读取，必须先设好环境变量再导入爬虫
+    os.environ["BUFF_BASE_URL"] = base_url
+    os.environ["YOUPIN_BASE_URL"] = base_url
+    os.environ["BROWSER_CHANNEL"] = args.channel
+    os.environ["BROWSER_HEADLESS"] = "0" if args.headed else "1"
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    for name in COPY_FILES:
+        if os.path.exists(os.path.join(HERE, name)):
+            shutil.copy(os.path.join(HERE, name), workdir)
+    write_fake_auth(workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    import browser_service
+    import buff_scraper
+    import youpin_scraper
+    buff_scraper.USE_HTTP_API = args.buff_mode == "api"
+    buff_scraper.DELTA_POLLING = not args.no_delta
+    youpin_scraper.CAPTURE_API = args.uu_mode == "api"
+
+    print(f"🧪 假市场服务: {base_url}  工作目录: {workdir}")
+    rows = []
+    try:
+        markets = [m.strip() for m in args.markets.split(",") if m.strip()]
+        if "buff" in markets:
+            rows += run_market("BUFF", buff_scraper, args.rounds)
+        if "uu" in markets:
+            rows += run_market("YouPin", youpin_scraper, args.rounds)
+    finally:
+        browser_service.shutdown()
+        server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import threading
+import time
+
+try:
+    import psutil  # 可选：用于按内存上限回收
+except ImportError:
+    psutil = None
+
+# ================= 配置区 =================
+MAX_NAVIGATIONS = 300   # 单个 context 累计导航次数上限，超过后重建
+MAX_RSS_MB = 1500       # 浏览器进程树内存上限 (MB)，需要 psutil
+LAUNCH_ARGS = ["--disable-blink-features=AutomationControlled"]
+# 浏览器渠道与是否无头，可用环境变量覆盖 (基准测试用 BROWSER_CHANNEL= 空串走自带 Chromium)
+BROWSER_CHANNEL = os.environ.get("BROWSER_CHANNEL", "msedge")
+HEADLESS = os.environ.get("BROWSER_HEADLESS", "0") == "1"
+# =========================================
+
+
+def browser_rss_mb():
+    """本进程所有子进程 (Playwright 驱动 + 浏览器) 的内存总和；无 psutil 时返回 None"""
+    if psutil is None: return None
+    total = 0
+    try:
+        for child in psutil.Process().children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+    except psutil.Error:
+        return None
+    return total / 1024 / 1024
+
+
+class _WarmContext:
+    """一个市场的常驻 context 及其使用计数"""
+
+    def __init__(self, context, auth_mtime):
+        self.context = context
+        self.auth_mtime = auth_mtime
+        self.navigations = 0
+        self.created_at = time.time()
+
+
+class BrowserService:
+    """
+    常驻浏览器服务：
+    - 独立线程跑 asyncio 事件循环，浏览器只启动一次，跨轮次保持
+    - 每个市场一个已登录的 context，下一轮直接复用
+    - 导航次数 / 内存超限、或登录文件被更新时，重建 context
+    - 需要整体重启浏览器而别的市场还持有 context 时，推迟到下一轮开始 (begin_cycle) 再重启
+    任意线程都可以通过 run() 把协程交给服务执行。
+    """
+
+    def __init__(self, max_navigations=MAX_NAVIGATIONS, max_rss_mb=MAX_RSS_MB):
+        self.max_navigations = max_navigations
+        self.max_rss_mb = max_rss_mb
+
+        self._pw = None
+        self._browser = None
+        self._contexts = {}
+        self._lock = None
+        self.restart_pending = False
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop_main, name="browser-service", daemon=True)
+        self._thread.start()
+
+    def _loop_main(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def run(self, coro):
+        """在服务线程中执行协程，阻塞等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    # ------------------------------------------------------------
+    # 以下方法运行在服务线程的事件循环里
+    # ------------------------------------------------------------
+    async def _ensure_browser(self):
+        if self._browser and self._browser.is_connected(): return
+        if self._pw is None:
+            from playwright.async_api import async_playwright  # 第一次用浏览器时才加载 (加快启动)
+            self._pw = await async_playwright().start()
+        print("🚀 [浏览器服务] 启动浏览器...")
+        self._browser = await self._pw.chromium.launch(channel=BROWSER_CHANNEL or None,
+                                                      headless=HEADLESS, args=LAUNCH_ARGS)
+        self._contexts.clear()
+
+    def _needs_recycle(self, market, warm, auth_mtime):
+        if warm.auth_mtime != auth_mtime:
+            print(f"🔄 [浏览器服务] {market} 登录文件已更新，重建 context")
+            return True
+        if warm.navigations >= self.max_navigations:
+            print(f"🔄 [浏览器服务] {market} 已导航 {warm.navigations} 次，回收 context")
+            return True
+        rss = browser_rss_mb()
+        if rss is not None and rss > self.max_rss_mb:
+            print(f"🔄 [浏览器服务] 浏览器内存 {rss:.0f}MB 超过上限，回收 {market} context")
+            return True
+        return False
+
+    async def acquire(self, market, storage_state=None, setup=None, **context_options):
+        """
+        取得某个市场的常驻 context (没有或需要回收时新建)。
+        setup: 可选协程函数 setup(context)，只在新建时调用一次 (安装路由等)。
+        回收只在 acquire 时发生，且只回收本市场的 context；正在使用的 context 不会被中途关闭。
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            await self._ensure_browser()
+
+            auth_mtime = None
+            if storage_state and os.path.exists(storage_state):
+                auth_mtime = os.path.getmtime(storage_state)
+            else:
+                storage_state = None
+
+            warm = self._contexts.get(market)
+            if warm and self._needs_recycle(market, warm, auth_mtime):
+                await self._close_context(market)
+                warm = None
+
+                # 关掉 context 后内存仍然超标，说明浏览器本身在泄漏，整体重启。
+                # 内存按整个浏览器进程树算，别的市场的标签页可能正在抓取，这时只做标记，等下一轮开始再重启
+                rss = browser_rss_mb()
+                if rss is not None and rss > self.max_rss_mb:
+                    if self._contexts:
+                        print(f"⏳ [浏览器服务] 内存仍有 {rss:.0f}MB，"
+                              f"{'/'.join(self._contexts)} 还在使用，下一轮开始时重启浏览器")
+                        self.restart_pending = True
+                    else:
+                        print(f"♻️ [浏览器服务] 内存仍有 {rss:.0f}MB，重启浏览器")
+                        await self._restart_browser()
+
+            if warm is None:
+                context = await self._browser.new_context(storage_state=storage_state, **context_options)
+                if setup:
+                    await setup(context)
+                warm = _WarmContext(context, auth_mtime)
+                self._contexts[market] = warm
+                print(f"🔥 [浏览器服务] {market} context 已就绪")
+
+            return warm.context
+
+    def count_navigation(self, market, n=1):
+        warm = self._contexts.get(market)
+        if warm: warm.navigations += n
+
+    async def _close_context(self, market):
+        warm = self._contexts.pop(market, None)
+        if warm:
+            try:
+                await warm.context.close()
+            except: pass
+
+    async def _restart_browser(self):
+        self.restart_pending = False
+        for market in list(self._contexts):
+            await self._close_context(market)
+        if self._browser:
+            try:
+                await self._browser.close()
+            except: pass
+        self._browser = None
+        await self._ensure_browser()
+
+    async def _restart_if_pending(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.restart_pending:
+                print("♻️ [浏览器服务] 执行上一轮推迟的浏览器重启")
+                await self._restart_browser()
+
+    async def _shutdown(self):
+        for market in list(self._contexts):
+            await self._close_context(market)
+        if self._browser:
+            try:
+                await self._browser.close()
+            except: pass
+        if self._pw:
+            await self._pw.stop()
+        self._browser = None
+        self._pw = None
+
+    # ------------------------------------------------------------
+    def close(self):
+        try:
+            self.run(self._shutdown())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+
+# 进程内单例
+_service = None
+_service_lock = threading.Lock()
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = BrowserService()
+        return _service
+
+def begin_cycle():
+    """每轮抓取开始前调用 (此时没有市场在用 context)：执行上一轮推迟的浏览器重启"""
+    with _service_lock:
+        service = _service
+    if service is not None and service.restart_pending:
+        service.run(service._restart_if_pending())
+
+def shutdown():
+    """关闭常驻浏览器 (程序退出，或不需要保温时每轮结束调用)"""
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+        _service = None
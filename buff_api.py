@@ -0,0 +1,146 @@
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import os
+import time
+import threading
+
+# ================= 配置区 =================
+# 可用环境变量指向本地 fixture_server.py 做离线调试
+BUFF_BASE_URL = os.environ.get("BUFF_BASE_URL", "https://buff.163.com")
+AUTH_FILE = "buff_auth.json"   # get_cookie_buff.py 保存的登录状态
+POOL_SIZE = 4                  # keep-alive 连接池大小
+REQUEST_TIMEOUT = 6            # 单次请求超时 (秒)
+USER_INFO_PATH = "/account/api/user/info"   # 登录校验用的轻量接口
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0")
+# =========================================
+
+
+class BuffApiError(Exception):
+    """直连接口不可用 (未登录 / 被限流 / 网络错误)，调用方应回退到浏览器"""
+
+
+class BuffRateLimited(BuffApiError):
+    """HTTP 429 或返回了验证码页：调用方应放慢请求速率"""
+
+
+def load_cookie_header(auth_file=AUTH_FILE, domain_keyword="163.com"):
+    """从 Playwright storage_state 文件中取出 BUFF 的 cookie，拼成 Cookie 请求头"""
+    if not os.path.exists(auth_file): return ""
+    try:
+        with open(auth_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except: return ""
+
+    pairs = []
+    for c in state.get("cookies", []):
+        if domain_keyword in c.get("domain", "") and c.get("name"):
+            pairs.append(f"{c['name']}={c.get('value', '')}")
+    return "; ".join(pairs)
+
+
+class BuffApiClient:
+    """
+    直接调用 BUFF 的 goods/sell_order 接口。
+    复用同一个 requests.Session，底层连接保持 keep-alive，省掉整页渲染。
+    """
+
+    def __init__(self, auth_file=AUTH_FILE, base_url=None, pool_size=POOL_SIZE):
+        self.base_url = (base_url or BUFF_BASE_URL).rstrip("/")
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "X-Requested-With": "XMLHttpRequest",
+        })
+        # 手动拼 Cookie 头：域名与 base_url 无关，指向本地 fixture 时同样带上
+        cookie_header = load_cookie_header(auth_file)
+        if cookie_header:
+            self.session.headers["Cookie"] = cookie_header
+        self.logged_in = bool(cookie_header)
+
+    def fetch_sell_order(self, goods_id, page_num=1):
+        """
+        拉取一页在售列表
+        返回 (items, total_page)；items 为接口原始字典列表
+        """
+        params = {
+            "game": "csgo",
+            "goods_id": goods_id,
+            "page_num": page_num,
+            "sort_by": "default",
+            "mode": "",
+            "allow_tradable_cooldown": 1,
+            "_": int(time.time() * 1000),
+        }
+        headers = {"Referer": f"{self.base_url}/goods/{goods_id}?from=market"}
+
+        try:
+            resp = self.session.get(f"{self.base_url}/api/market/goods/sell_order",
+                                    params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            raise BuffApiError(f"网络错误: {e}")
+
+        if resp.status_code == 429:
+            raise BuffRateLimited("HTTP 429")
+        if resp.status_code != 200:
+            raise BuffApiError(f"HTTP {resp.status_code}")
+
+        try:
+            data = resp.json()
+        except ValueError:
+            raise BuffRateLimited("返回内容不是 JSON (可能是验证码页)")
+
+        if data.get("code") != "OK":
+            raise BuffApiError(f"接口返回 {data.get('code')}: {data.get('msg') or data.get('error')}")
+
+        body = data.get("data") or {}
+        return body.get("items", []), body.get("total_page", 1)
+
+    def check_login(self, timeout=REQUEST_TIMEOUT):
+        """
+        请求用户信息接口确认登录态：已登录返回 True，未登录返回 False
+        网络错误 / 非 JSON 抛 BuffApiError (无法判断)
+        """
+        try:
+            resp = self.session.get(f"{self.base_url}{USER_INFO_PATH}",
+                                    params={"_": int(time.time() * 1000)}, timeout=timeout)
+        except requests.RequestException as e:
+            raise BuffApiError(f"网络错误: {e}")
+
+        if resp.status_code != 200:
+            raise BuffApiError(f"HTTP {resp.status_code}")
+        try:
+            data = resp.json()
+        except ValueError:
+            raise BuffApiError("返回内容不是 JSON (可能是验证码页)")
+        return data.get("code") == "OK"
+
+    def close(self):
+        self.session.close()
+
+
+# 进程内共享一个客户端，连接池跨饰品、跨轮次复用
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = BuffApiClient(auth_file=AUTH_FILE)  # 分片子进程会改写 AUTH_FILE
+        return _client
+
+def reset_client():
+    """重新登录 (buff_auth.json 更新) 后调用，丢弃旧 cookie"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
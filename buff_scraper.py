@@ -1,224 +1,379 @@
-import pandas as pd
-from playwright.sync_api import sync_playwright
+import asyncio
 import re
-import json
 import os
 import time
+from collections import namedtuple
 from datetime import datetime
-from urllib.parse import quote
+
+import buff_api
+import catalog
+import recipes
+import browser_service
+import metrics
+import net_filter
+import pipeline
+import rate_limiter
+import resilience
+import session_check
+from orderbook import Ask
+from snapshot import MarketSnapshot, INDICATORS
+from stats_stream import ListingStream
 
 # ================= 配置区 =================
-INPUT_FILE = "task.xlsx"  # 你的任务文件
-DB_FILE = "gun_keys.json" # ID缓存文件
+AUTH_FILE = "buff_auth.json"
+USE_HTTP_API = True       # 优先直连 sell_order 接口，失败回退浏览器
+MAX_PAGES = 5             # 最多翻页数 (凑够配方所需材料数量即提前停止)
+EXPORT_EXCEL = True       # 额外导出 BUFF_数据_*.xlsx (后台线程，不影响计算)
+DELTA_POLLING = True      # 第一页与上次一致时不再翻页，直接沿用上次统计
+FINGERPRINT_SIZE = 10     # 指纹取第一页前几条挂单 (挂单 ID + 价格)
+DELTA_MAX_AGE = 6 * 3600  # 缓存统计最长沿用时间 (秒)，超过强制完整抓一次
+PAGE_SIZE = 10            # BUFF 每页挂单数
 # =========================================
 
-def load_db():
-    if not os.path.exists(DB_FILE): return {}
-    try:
-        with open(DB_FILE, "r", encoding="utf-8") as f: return json.load(f)
-    except: return {}
+# 增量轮询缓存：goods_id -> 上次的第一页指纹与结果 (进程内，跨轮次保留)
+DeltaEntry = namedtuple("DeltaEntry", ["fingerprint", "stats", "ladder", "depth", "ts"])
+_delta_cache = {}
 
-def save_db(data):
-    try:
-        with open(DB_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-    except: pass
+def get_target_skins(book=None):
+    """汇总所有配方 (task.xlsx / recipes.json) 用到的饰品，去重后一次抓完"""
+    book = book or recipes.RecipeBook(recipes.load_recipes())
+    # 产出已按配方磨损补齐 (如没写磨损，自动加上 (久经沙场))，材料保持原样
+    targets = [t["name"] for t in book.targets()]
+    print(f"📋 已加载 {len(targets)} 个目标: {targets}")
+    return targets
+
+async def _setup_context(context):
+    # 请求路由：默认只拦图片 / 媒体 / 字体，strict 模式只放行页面、脚本和 sell_order / 搜索接口 (见 net_filter.py)
+    await net_filter.install(context, "BUFF", buff_api.BUFF_BASE_URL)
+
+
+class BrowserSession:
+    """
+    按需使用常驻浏览器服务：只有需要搜索 ID 或接口回退时才取 BUFF 的 context。
+    浏览器和登录态由 browser_service 跨轮次保温，这里只管本轮用的标签页。
+    """
+
+    def __init__(self):
+        self.service = None
+        self._page = None
+
+    async def get_page(self):
+        if self._page is None or self._page.is_closed():
+            if not os.path.exists(AUTH_FILE):
+                print(f"⚠️ 未找到登录信息 {AUTH_FILE}，将以未登录模式运行")
+            context = await self.service.acquire("BUFF", AUTH_FILE, setup=_setup_context)
+            self._page = await context.new_page()
+        return self._page
+
+    def run(self, coro_fn, *args):
+        """把浏览器操作交给服务线程执行"""
+        if self.service is None:
+            self.service = browser_service.get_service()
+        return self.service.run(coro_fn(self, *args))
+
+    def close(self):
+        if self._page is not None:
+            page, self._page = self._page, None
+            try:
+                self.service.run(page.close())
+            except: pass
+
+
+async def search_goods_id(session, skin_name, db):
+    """在 BUFF 市场搜索框中查找饰品 ID，成功后写入缓存"""
+    page = await session.get_page()
+    timeout = resilience.get_guard("BUFF").timeout("search")
+    await rate_limiter.get_limiter("BUFF").acquire_async()
+    session.service.count_navigation("BUFF")
+    await page.goto(f"{buff_api.BUFF_BASE_URL}/market/csgo#tab=selling")
+
+    search_input = page.locator("input[name='search']").first
+    await search_input.wait_for(state="visible", timeout=timeout.ms)
+
+    await search_input.click()
+    await search_input.clear()
+    await search_input.fill(skin_name)
 
-def get_target_skins():
-    """解析 task.xlsx 获取目标饰品列表"""
-    targets = []
+    await asyncio.sleep(1.0) # 等联想下拉框出现 (界面等待，不是请求节奏)
+    await page.keyboard.press("ArrowDown")
+    await asyncio.sleep(0.2)
+    await page.keyboard.press("Enter")
+
+    t0 = time.perf_counter()
+    await page.wait_for_url(re.compile(r".*/goods/\d+"), timeout=timeout.ms)
+    timeout.observe(time.perf_counter() - t0)
+
+    match = re.search(r"goods/(\d+)", page.url)
+    if not match: return None
+
+    goods_id = match.group(1)
+    db.set(skin_name, "buff_id", goods_id)
+    return goods_id
+
+
+def parse_ask(item):
+    """sell_order 接口的一条挂单 -> Ask；每条挂单是 1 件"""
+    price = item.get('price')
+    if not price: return None
+    wear = (item.get('asset_info') or {}).get('paintwear')
     try:
-        # 读取 Excel，不带表头，方便按行索引
-        df = pd.read_excel(INPUT_FILE, header=None)
-        
-        # 1. 获取第一行（产出物）：强制追加 (久经沙场)
-        row1_targets = df.iloc[0, 1:].dropna().astype(str).tolist()
-        for t in row1_targets:
-            name = t.strip()
-            if name:
-                # 【关键修改】如果没有写磨损，自动加上 (久经沙场)
-                if "(久经沙场)" not in name:
-                    name = f"{name} (久经沙场)"
-                targets.append(name)
-        
-        # 2. 获取第3-6行的第二列（材料）：保持原样
-        # (通常材料在Excel里已经写全了磨损，如果没有，你也可以在这里照样加)
-        col2_targets = df.iloc[2:6, 1].dropna().astype(str).tolist()
-        targets.extend([t.strip() for t in col2_targets if t.strip()])
-        
-        print(f"📋 已加载 {len(targets)} 个目标: {targets}")
-        return targets
-    except Exception as e:
-        print(f"❌ 读取 {INPUT_FILE} 失败: {e}")
-        return []
-
-def run_scraper():
-    target_skins = get_target_skins()
+        wear = float(wear) if wear else None
+    except ValueError:
+        wear = None
+    return Ask(float(price), 1, wear, "BUFF")
+
+
+def page_fingerprint(items, total_page):
+    """第一页指纹：总页数 + 前几条挂单的 (ID, 价格)；有人上架/下架/改价都会变"""
+    return (total_page, tuple((item.get('id'), item.get('price')) for item in items[:FINGERPRINT_SIZE]))
+
+
+def fetch_page_api(client, goods_id, p_num):
+    """单页接口请求，失败按重试预算退避重试；重试用完仍失败则抛出 BuffApiError"""
+    guard = resilience.get_guard("BUFF")
+    limiter = rate_limiter.get_limiter("BUFF")
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            with metrics.timer("api_page", market="BUFF"):
+                result = client.fetch_sell_order(goods_id, p_num)
+            limiter.reward()
+            return result
+        except buff_api.BuffApiError as e:
+            if isinstance(e, buff_api.BuffRateLimited):
+                limiter.penalize(str(e))
+            if not guard.retry(attempt):
+                raise
+            print(f"   🔁 接口失败，第 {attempt + 1} 次重试: {e}")
+            attempt += 1
+
+
+def fetch_listings_api(client, goods_id, depth, known=None):
+    """
+    直连接口抓取挂单 (边收边统计)，凑够 depth 件即停；失败抛 BuffApiError 由调用方回退
+    返回 (ListingStream, 第一页指纹)；第一页指纹等于 known 时立即返回 (None, 指纹)
+    """
+    stream = ListingStream(depth)
+    fingerprint = None
+    for p_num in range(1, MAX_PAGES + 1):
+        items, total_page = fetch_page_api(client, goods_id, p_num)
+        print(f"   ---> ⚡ 接口数据: {len(items)} 条")
+        if p_num == 1:
+            fingerprint = page_fingerprint(items, total_page)
+            if known is not None and fingerprint == known:
+                return None, fingerprint
+        for item in items:
+            stream.add(parse_ask(item))
+
+        # === 智能跳过: 第一页无数据 / 已到最后一页 / 深度已够 ===
+        if not items or p_num >= total_page or stream.units >= depth:
+            break
+    return stream, fingerprint
+
+
+async def fetch_listings_browser(session, goods_id, depth, known=None):
+    """
+    浏览器回退：打开详情页，拦截 sell_order 响应；返回值同 fetch_listings_api
+    第一页拿不到 (超时 / 出错) 且重试用完时抛出异常，由调用方记为失败
+    """
+    page = await session.get_page()
+    guard = resilience.get_guard("BUFF")
+    limiter = rate_limiter.get_limiter("BUFF")
+    timeout = guard.timeout("sell_order")
+    stream = ListingStream(depth)
+    fingerprint = None
+    base_url = f"{buff_api.BUFF_BASE_URL}/goods/{goods_id}"
+    p_num, attempt = 1, 0
+
+    while p_num <= MAX_PAGES:
+        target_url = f"{base_url}?from=market#tab=selling&page_num={p_num}"
+        items = []
+
+        try:
+            # === 优化点 2: 移除 reload，直接在 goto 时捕获请求 ===
+            await limiter.acquire_async()
+            t0 = time.perf_counter()
+            with metrics.timer("navigation", market="BUFF"):
+                async with page.expect_response(lambda r: "goods/sell_order" in r.url and r.status == 200, timeout=timeout.ms) as resp_info:
+                    session.service.count_navigation("BUFF")
+                    await page.goto(target_url)
+                resp = await resp_info.value
+            timeout.observe(time.perf_counter() - t0)
+            limiter.reward()
+            with metrics.timer("response_capture", market="BUFF"):
+                data = (await resp.json()).get('data', {})
+            items = data.get('items', [])
+            print(f"   ---> 📦 捕获数据: {len(items)} 条")
+            if p_num == 1:
+                fingerprint = page_fingerprint(items, data.get('total_page', 1))
+                if known is not None and fingerprint == known:
+                    return None, fingerprint
+            for item in items:
+                stream.add(parse_ask(item))
+        except Exception as e:
+            if "Timeout" in type(e).__name__:
+                metrics.inc("timeout", market="BUFF", stage="sell_order")
+            if rate_limiter.looks_like_captcha(page.url):
+                limiter.penalize("验证码页")
+            if p_num == 1:
+                # 第一页都没拿到：退避重试 (先离开当前页，否则同地址 goto 不会重新请求)
+                if await guard.retry_async(attempt):
+                    print(f"   🔁 详情页未拿到数据，第 {attempt + 1} 次重试")
+                    attempt += 1
+                    await page.goto("about:blank")
+                    continue
+                raise
+
+        # === 优化点 3: 智能跳过 ===
+        if p_num == 1 and stream.units == 0:
+            print("   ⚠️ 第一页无数据，跳过后续页")
+            break
+        if not items or stream.units >= depth:
+            break
+
+        p_num += 1
+    return stream, fingerprint
+
+
+def cached_entry(goods_id, depth):
+    """
+    可沿用的上次结果：深度足够且未过期，否则 None。
+    depth 不超过一页时本来就只请求第 1 页，比对指纹省不下请求，反而会沿用旧的均值 / 数量，直接完整抓
+    """
+    if not DELTA_POLLING or depth <= PAGE_SIZE: return None
+    entry = _delta_cache.get(goods_id)
+    if entry and entry.depth >= depth and time.time() - entry.ts <= DELTA_MAX_AGE:
+        return entry
+    return None
+
+
+def run_scraper(only=None):
+    """only: 可选的规范键集合，只抓其中的饰品 (调度器按需抓取)"""
+    book = recipes.RecipeBook(recipes.load_recipes())
+    target_skins = get_target_skins(book)
+    if only is not None:
+        target_skins = [n for n in target_skins if catalog.get_catalog().key(n) in only]
     if not target_skins: return
+    if not session_check.preflight("BUFF"): return  # 登录失效：整个市场跳过，不逐件等超时
+    depth = book.max_input_count()  # 每件至少要看到的挂单数量
 
-    file_timestamp = datetime.now().strftime('%m%d(%H)')
-    db = load_db()
+    started_at = datetime.now()
+    db = catalog.get_catalog()  # 名称 -> ID (各种写法统一解析)
     
-    # 用于存储最终统计结果的字典
+    # 用于存储最终统计结果与挂单深度的字典
     final_stats = {}
+    final_ladders = {}
 
-    with sync_playwright() as p:
-        print("🚀 启动浏览器...")
-        # 启动参数优化：使用 Edge，禁用自动化特征
-        browser = p.chromium.launch(channel="msedge", headless=False, args=["--disable-blink-features=AutomationControlled"])
-        
-        try:
-            context = browser.new_context(storage_state="buff_auth.json")
-        except:
-            print("⚠️ 未找到登录信息 buff_auth.json，将以未登录模式运行")
-            context = browser.new_context()
-
-        page = context.new_page()
-        
-        # === 优化点 1: 扩大资源屏蔽范围 (字体、媒体也屏蔽，提速明显) ===
-        page.route("**/*.{png,jpg,jpeg,gif,webp,svg,mp4,woff,woff2,ttf}", lambda route: route.abort())
-
-        # 当前正在处理的临时价格列表
-        current_prices = []
-
-        # --- 数据拦截器 ---
-        def handle_response(response):
-            if "goods/sell_order" in response.url and response.status == 200:
-                try:
-                    data = response.json()
-                    items = data.get('data', {}).get('items', [])
-                    print(f"   ---> 📦 捕获数据: {len(items)} 条")
-                    for item in items:
-                        price = item.get('price')
-                        if price:
-                            current_prices.append(float(price))
-                except: pass
-
-        page.on("response", handle_response)
+    client = buff_api.get_client() if USE_HTTP_API else None
+    if client and not client.logged_in:
+        print("⚠️ 未找到登录信息 buff_auth.json，接口将以未登录模式请求")
+    session = BrowserSession()
+    unchanged = 0
+    guard = resilience.get_guard("BUFF")
+    guard.new_cycle()
+    stale = set()  # 熔断跳过 / 抓取失败的饰品，主程序沿用价格库里的旧价
 
+    try:
         # ================= 循环处理每个饰品 =================
         for idx, skin_name in enumerate(target_skins):
-            print(f"\n[{idx+1}/{len(target_skins)}] 正在处理: {skin_name}")
-            
-            # 1. 获取 ID
-            goods_id = db.get(skin_name)
-            if not goods_id:
-                print(f"   ⚠️ 本地无ID，执行搜索...")
-                page.goto("https://buff.163.com/market/csgo#tab=selling")
-                
-                try:
-                    search_input = page.locator("input[name='search']").first
-                    search_input.wait_for(state="visible", timeout=5000)
-                    
-                    search_input.click()
-                    search_input.clear()
-                    search_input.fill(skin_name)
-                    
-                    time.sleep(1.0) # 稍微减少等待时间
-                    page.keyboard.press("ArrowDown")
-                    time.sleep(0.2)
-                    page.keyboard.press("Enter")
-
-                    page.wait_for_url(re.compile(r".*/goods/\d+"), timeout=8000)
-                    
-                    match = re.search(r"goods/(\d+)", page.url)
-                    if match:
-                        goods_id = match.group(1)
-                        db[skin_name] = goods_id
-                        save_db(db)
-                        print(f"   ✅ 捕获成功 ID: {goods_id}")
-                    else:
+            with metrics.timer("item", market="BUFF"), \
+                    pipeline.item("BUFF", skin_name, final_stats, final_ladders, stale):
+                print(f"\n[{idx+1}/{len(target_skins)}] 正在处理: {skin_name}")
+                if not guard.breaker.allow():
+                    print("   ⛔ BUFF 已熔断，跳过 (沿用旧数据)")
+                    stale.add(skin_name)
+                    final_stats[skin_name] = None
+                    continue
+
+                # 1. 获取 ID (只有缓存未命中才需要浏览器)
+                goods_id = db.get(skin_name, "buff_id")
+                if not goods_id:
+                    print(f"   ⚠️ 本地无ID，执行搜索...")
+                    try:
+                        with metrics.timer("id_search", market="BUFF"):
+                            goods_id = session.run(search_goods_id, skin_name, db)
+                    except Exception as e:
+                        if "Timeout" in type(e).__name__:
+                            metrics.inc("timeout", market="BUFF", stage="id_search")
+                        print(f"   ❌ 搜索失败: {e}")
+                        guard.breaker.record_failure()
+                        stale.add(skin_name)
+                        final_stats[skin_name] = None
+                        continue
+                    if not goods_id:
                         print("   ❌ 未发现ID，跳过")
+                        stale.add(skin_name)
                         final_stats[skin_name] = None
                         continue
-                except Exception as e:
-                    print(f"   ❌ 搜索失败: {e}")
-                    final_stats[skin_name] = None
+                    print(f"   ✅ 捕获成功 ID: {goods_id}")
+
+                # 2. 抓取数据：优先直连接口，失败再回退浏览器
+                #    第一页与上次指纹一致 -> 不再翻页，沿用上次统计
+                cached = cached_entry(goods_id, depth)
+                known = cached.fingerprint if cached else None
+                stream = fingerprint = None
+                fetched = False
+                if client:
+                    try:
+                        stream, fingerprint = fetch_listings_api(client, goods_id, depth, known)
+                        fetched = True
+                    except buff_api.BuffApiError as e:
+                        print(f"   ⚠️ 接口失败，回退浏览器: {e}")
+                        metrics.inc("api_fallback", market="BUFF")
+                if not fetched:
+                    try:
+                        stream, fingerprint = session.run(fetch_listings_browser, goods_id, depth, known)
+                    except Exception as e:
+                        print(f"   ❌ 详情页抓取失败: {e}")
+                        guard.breaker.record_failure()
+                        stale.add(skin_name)
+                        final_stats[skin_name] = None
+                        continue
+                guard.breaker.record_success()
+
+                if stream is None:
+                    print(f"   ♻️ 第一页无变化，沿用上次统计: 最低 {cached.stats['最低']}")
+                    unchanged += 1
+                    metrics.inc("unchanged", market="BUFF")
+                    final_stats[skin_name] = cached.stats
+                    final_ladders[skin_name] = cached.ladder
                     continue
+                final_ladders[skin_name] = stream.ladder()
 
-            # 2. 抓取数据 (性能优化核心部分)
-            current_prices = [] 
-            base_url = f"https://buff.163.com/goods/{goods_id}"
-            
-            page_nums = [1, 2] 
-            
-            for p_num in page_nums:
-                target_url = f"{base_url}?from=market#tab=selling&page_num={p_num}"
-                
-                try:
-                    # === 优化点 2: 移除 reload，直接在 goto 时捕获请求 ===
-                    with page.expect_response(lambda r: "goods/sell_order" in r.url and r.status == 200, timeout=6000):
-                        page.goto(target_url)
-                except:
-                    pass
-                
-                # === 优化点 3: 智能跳过 ===
-                if p_num == 1 and len(current_prices) == 0:
-                    print("   ⚠️ 第一页无数据，跳过后续页")
-                    break
-
-                time.sleep(0.5)
-
-            # 3. 计算统计指标
-            if current_prices:
-                stats = {
-                    "最高": max(current_prices),
-                    "最低": min(current_prices),
-                    "均值": round(sum(current_prices) / len(current_prices), 2),
-                    "中位数": sorted(current_prices)[len(current_prices) // 2]
-                }
-                print(f"   ✅ 统计完成: 最低 {stats['最低']}")
-                final_stats[skin_name] = stats
-            else:
-                print("   ⚠️ 无在售数据")
-                final_stats[skin_name] = {"最高": 0, "最低": 0, "均值": 0, "中位数": 0}
-
-            time.sleep(0.5)
-
-        browser.close()
-
-    # ================= Excel 生成逻辑 =================
-    output_filename = f"BUFF_数据_{file_timestamp}.xlsx"
-    print(f"\n📊 正在生成: {output_filename}")
+                # 3. 统计指标 (抓取时已流式累计)
+                stats = stream.stats.to_stats()
+                if stats and fingerprint is not None:
+                    _delta_cache[goods_id] = DeltaEntry(fingerprint, stats, final_ladders[skin_name], depth, time.time())
+                if stats:
+                    print(f"   ✅ 统计完成: 最低 {stats['最低']}")
+                    final_stats[skin_name] = stats
+                else:
+                    print("   ⚠️ 无在售数据")
+                    metrics.inc("empty", market="BUFF")
+                    final_stats[skin_name] = {k: 0 for k in INDICATORS}
+    finally:
+        session.close()
+    net_filter.cycle_report("BUFF", len(target_skins))
 
-    try:
-        data_for_df = {}
-        indicators = ["最高", "最低", "均值", "中位数"]
-        
-        for skin in target_skins:
-            stats = final_stats.get(skin)
-            if stats:
-                data_for_df[skin] = [stats[k] for k in indicators]
-            else:
-                data_for_df[skin] = ["-", "-", "-", "-"]
-
-        df = pd.DataFrame(data_for_df, index=indicators)
-
-        with pd.ExcelWriter(output_filename, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name="统计数据")
-            
-            workbook = writer.book
-            worksheet = writer.sheets["统计数据"]
-            yellow_fmt = workbook.add_format({'bg_color': '#FFFF00', 'bold': True})
-            
-            target_row_idx = 2 
-            
-            for col_idx, col_name in enumerate(df.columns):
-                val = df.loc["最低", col_name]
-                worksheet.write(target_row_idx, col_idx + 1, val, yellow_fmt)
-            
-            worksheet.write(target_row_idx, 0, "最低", yellow_fmt)
-
-        print("✅ Excel 生成完毕!")
-
-    except Exception as e:
-        print(f"❌ Excel 生成失败: {e}")
-        import traceback
-        traceback.print_exc()
+    if unchanged:
+        print(f"\n♻️ {unchanged}/{len(target_skins)} 件第一页无变化，已跳过翻页")
+    if stale:
+        print(f"\n⚠️ {len(stale)} 件未抓到 (熔断 / 失败)，本轮沿用旧数据")
+        metrics.inc("stale", len(stale), market="BUFF")
+    return MarketSnapshot("BUFF", "BUFF_数据", target_skins, final_stats, started_at, final_ladders, stale)
 
 # 封装供主程序调用
-def main_task():
-    run_scraper()
+def main_task(export_excel=EXPORT_EXCEL, only=None):
+    """返回 MarketSnapshot；Excel 在后台线程导出，不占主流程时间"""
+    snapshot = run_scraper(only)
+    if snapshot and export_excel:
+        snapshot.export_excel_async()
+    return snapshot
 
 if __name__ == "__main__":
-    main_task()
\ No newline at end of file
+    try:
+        snapshot = run_scraper()
+        if snapshot: snapshot.export_excel()
+    finally:
+        browser_service.shutdown()
\ No newline at end of file
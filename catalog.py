@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+
+# ================= 配置区 =================
+CATALOG_FILE = "item_catalog.json"   # 统一饰品目录 (BUFF ID / 悠悠商品页 / 磨损)
+DEFAULT_WEAR = "久经沙场"              # 名称没写磨损时按此处理 (与 task.xlsx 的约定一致)
+WEARS = ["崭新出厂", "略有磨损", "久经沙场", "破损不堪", "战痕累累"]
+# 旧版缓存文件，首次运行时自动导入
+LEGACY_FILES = {"buff_id": "gun_keys.json", "uu_url": "uu_keys.json"}
+# =========================================
+
+_WEAR_SUFFIX = re.compile(r"\(\s*(" + "|".join(WEARS) + r")\s*\)\s*$")
+
+
+def parse_name(name):
+    """
+    拆分饰品名，返回 (规范键, 展示名, 磨损)
+    - 全角转半角 (NFKC)：（久经沙场）/｜ 等统一
+    - 去掉末尾 (可能重复的) 磨损后缀，如 "裹手|恶土(久经沙场) (久经沙场)"
+    - 规范键去掉全部空白并转小写，"AK-47 | 红线" 与 "AK-47|红线" 视为同一件
+    """
+    text = unicodedata.normalize("NFKC", str(name)).strip()
+
+    wear = None
+    while True:
+        m = _WEAR_SUFFIX.search(text)
+        if not m: break
+        wear = wear or m.group(1)  # 以最后一个后缀为准
+        text = text[:m.start()].rstrip()
+    wear = wear or DEFAULT_WEAR
+
+    base_display = re.sub(r"\s+", " ", text)
+    base_key = re.sub(r"\s+", "", text).lower()
+    return f"{base_key}#{wear}", f"{base_display} ({wear})", wear
+
+
+def normalize_name(name):
+    """只取规范键"""
+    return parse_name(name)[0]
+
+
+class Catalog:
+    """
+    一件饰品一条记录，跨市场共用：
+        items:   规范键 -> {"name", "wear", "buff_id", "uu_url"}
+        aliases: 别名的规范键 -> 规范键 (手工维护的简称/旧名)
+    所有模块都通过这里把各种写法的名字解析到同一条记录。
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self.items = {}
+        self.aliases = {}
+        self._load()
+
+    # ---------------- 读写 ----------------
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.items = data.get("items", {})
+                self.aliases = data.get("aliases", {})
+            except: pass
+        # 仓库里自带 item_catalog.json，老安装升级后本地学到的 ID / 商品页只在旧文件里，每次启动都合并
+        self._import_legacy()
+
+    def _import_legacy(self):
+        """
+        把旧的 gun_keys.json / uu_keys.json 合并进目录 (同一 ID 的多种写法合为一条)。
+        目录里已有的字段不覆盖，只补缺的
+        """
+        imported = 0
+        for field, legacy in LEGACY_FILES.items():
+            if not os.path.exists(legacy): continue
+            try:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    mapping = json.load(f)
+            except: continue
+            for name, value in mapping.items():
+                if not value: continue
+                rec = self.record(name)
+                if not rec.get(field):
+                    rec[field] = str(value)
+                    imported += 1
+        if imported:
+            print(f"📚 已从旧缓存导入 {imported} 条记录 -> {self.path}")
+            self.save()
+
+    def save(self):
+        with self._lock:
+            payload = {"items": self.items, "aliases": self.aliases}
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False, indent=4)
+                os.replace(tmp, self.path)
+            except: pass
+
+    # ---------------- 查询 ----------------
+    def key(self, name):
+        """任意写法 -> 规范键 (先查别名表)"""
+        k = normalize_name(name)
+        return self.aliases.get(k, k)
+
+    def lookup(self, name):
+        """已有记录返回字典，否则 None"""
+        return self.items.get(self.key(name))
+
+    def record(self, name):
+        """取记录，不存在则新建"""
+        with self._lock:
+            k = self.key(name)
+            rec = self.items.get(k)
+            if rec is None:
+                _, display, wear = parse_name(name)
+                rec = {"name": display, "wear": wear}
+                self.items[k] = rec
+            return rec
+
+    def display_name(self, name):
+        rec = self.lookup(name)
+        return rec["name"] if rec else parse_name(name)[1]
+
+    def get(self, name, field):
+        rec = self.lookup(name)
+        return rec.get(field) if rec else None
+
+    # ---------------- 更新 ----------------
+    def set(self, name, field, value):
+        with self._lock:
+            self.record(name)[field] = value
+            self.save()
+
+    def drop(self, name, field):
+        with self._lock:
+            rec = self.lookup(name)
+            if rec and rec.pop(field, None) is not None:
+                self.save()
+
+    def add_alias(self, alias, name):
+        with self._lock:
+            self.aliases[normalize_name(alias)] = self.key(name)
+            self.save()
+
+
+# 进程内单例 (BUFF 线程与浏览器服务线程共用)
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
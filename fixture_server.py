@@ -0,0 +1,291 @@
+"""
+本地假市场服务器：离线调试 buff_api / buff_scraper / youpin_scraper，以及 bench_scrapers.py 基准测试用。
+
+BUFF:
+    /api/market/goods/sell_order   在售接口 (JSON)
+    /account/api/user/info         登录校验接口 (JSON)
+    /market/csgo                   市场页 (搜索框 input[name=search])
+    /market/search?q=名称          搜索跳转 -> /goods/{id}
+    /goods/{id}#page_num=N         商品页 (前端按 hash 请求 sell_order 并渲染)
+悠悠:
+    /market                        市场页 (搜索框 input.ant-input)
+    /uu/search?q=名称              搜索跳转 -> /goods-list?templateId={id}
+    /goods-list?templateId={id}    商品页 (前端请求在售列表接口并渲染 tr.ant-table-row)
+    /api/uu/commodity/list/sell    在售列表接口 (JSON)
+
+可注入延迟 (--latency-ms) 与随机失败 (--fail-rate，接口返回 --fail-status，默认 503)。
+
+用法:
+    python fixture_server.py                 # 默认 127.0.0.1:8765
+    python fixture_server.py --check         # 启动后用 BuffApiClient 自检一遍
+    set BUFF_BASE_URL=http://127.0.0.1:8765  # 再运行 buff_scraper.py 即走本地数据
+    set YOUPIN_BASE_URL=http://127.0.0.1:8765
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+import argparse
+import html
+import json
+import random
+import threading
+import time
+import zlib
+
+# ================= 配置区 =================
+HOST = "127.0.0.1"
+PORT = 8765
+PAGE_SIZE = 10       # BUFF 网页端每页 10 条
+TOTAL_PAGES = 3
+LATENCY_MS = 0       # 每个请求的额外延迟
+FAIL_RATE = 0.0      # 接口随机失败比例 (0 ~ 1)
+FAIL_STATUS = 503    # 失败时返回的状态码 (429 可用来测试限流退避)
+# =========================================
+
+
+def goods_id_for(name):
+    """饰品名 -> 确定性的商品 ID (两个市场共用)"""
+    return str(10000 + zlib.crc32(name.strip().encode("utf-8")) % 90000)
+
+
+def make_listings(goods_id, page_num, page_size=PAGE_SIZE):
+    """按 goods_id 生成确定性的在售列表 (价格升序，跨页连续)"""
+    rng = random.Random(int(goods_id) if str(goods_id).isdigit() else zlib.crc32(str(goods_id).encode("utf-8")))
+    base = round(rng.uniform(20, 2000), 1)
+    step = round(base * 0.004, 2) or 0.01
+
+    items = []
+    start = (page_num - 1) * page_size
+    for i in range(start, start + page_size):
+        items.append({
+            "id": f"{goods_id}-{i}",
+            "price": f"{base + step * i:.2f}",
+            "asset_info": {"paintwear": f"{0.15 + (i % 20) * 0.01:.4f}"},
+        })
+    return items
+
+
+# ---------------- 页面模板 ----------------
+BUFF_MARKET_HTML = """<!doctype html><html><head><meta charset="utf-8"><title>BUFF fixture</title></head>
+<body><input name="search" autocomplete="off">
+<script>
+document.querySelector("input[name=search]").addEventListener("keydown", e => {
+  if (e.key === "Enter") location.href = "/market/search?q=" + encodeURIComponent(e.target.value);
+});
+</script></body></html>"""
+
+BUFF_GOODS_HTML = """<!doctype html><html><head><meta charset="utf-8"><title>goods</title></head>
+<body><table id="list"></table>
+<script>
+async function load() {
+  const m = location.hash.match(/page_num=(\\d+)/);
+  const id = location.pathname.split("/").pop();
+  const r = await fetch(`/api/market/goods/sell_order?game=csgo&goods_id=${id}&page_num=${m ? m[1] : 1}`);
+  if (!r.ok) return;
+  const d = await r.json();
+  document.getElementById("list").innerHTML = (d.data.items || []).map(
+    it => `<tr class="selling"><td>${it.asset_info.paintwear}</td><td>¥ ${it.price}</td></tr>`).join("");
+}
+load();
+window.addEventListener("hashchange", load);
+</script></body></html>"""
+
+UU_MARKET_HTML = """<!doctype html><html><head><meta charset="utf-8"><title>UU fixture</title></head>
+<body><input class="ant-input" autocomplete="off">
+<script>
+document.querySelector("input.ant-input").addEventListener("keydown", e => {
+  if (e.key === "Enter") location.href = "/uu/search?q=" + encodeURIComponent(e.target.value);
+});
+</script></body></html>"""
+
+UU_GOODS_HTML = """<!doctype html><html><head><meta charset="utf-8"><title>goods</title></head>
+<body><table><tbody id="list"></tbody></table>
+<script>
+(async () => {
+  const id = new URLSearchParams(location.search).get("templateId");
+  const r = await fetch(`/api/uu/commodity/list/sell?templateId=${id}`);
+  if (!r.ok) return;
+  const d = await r.json();
+  document.getElementById("list").innerHTML = d.Data.CommodityList.map(
+    it => `<tr class="ant-table-row"><td>磨损：${it.Abrade}</td><td>¥${it.Price}</td></tr>`).join("");
+})();
+</script></body></html>"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # 由 make_server 注入
+    total_pages = TOTAL_PAGES
+    require_auth = False
+    latency = LATENCY_MS / 1000
+    fail_rate = FAIL_RATE
+    fail_status = FAIL_STATUS
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                   "application/json; charset=utf-8", status)
+
+    def _send_html(self, text):
+        self._send(text.encode("utf-8"), "text/html; charset=utf-8")
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _inject_failure(self):
+        """按 fail_rate 随机返回 fail_status，模拟网关错误 (503) / 限流 (429)"""
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._send_json({"code": "System Busy"}, status=self.fail_status)
+            return True
+        return False
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        q = query.get("q", [""])[0]
+
+        # ---------------- BUFF ----------------
+        if url.path == "/api/market/goods/sell_order":
+            if self._inject_failure(): return
+            if self.require_auth and "session=" not in self.headers.get("Cookie", ""):
+                self._send_json({"code": "Login Required", "msg": "请先登录"})
+                return
+
+            goods_id = query.get("goods_id", ["0"])[0]
+            try:
+                page_num = int(query.get("page_num", ["1"])[0])
+            except ValueError:
+                page_num = 1
+
+            items = make_listings(goods_id, page_num) if page_num <= self.total_pages else []
+            self._send_json({
+                "code": "OK",
+                "data": {"items": items, "page_num": page_num,
+                         "page_size": PAGE_SIZE, "total_page": self.total_pages},
+                "msg": None,
+            })
+            return
+        if url.path == "/account/api/user/info":
+            if self.require_auth and "session=" not in self.headers.get("Cookie", ""):
+                self._send_json({"code": "Login Required", "msg": "请先登录"})
+            else:
+                self._send_json({"code": "OK", "data": {"nickname": "fixture"}})
+            return
+        if url.path == "/market/csgo":
+            self._send_html(BUFF_MARKET_HTML)
+            return
+        if url.path == "/market/search":
+            self._redirect(f"/goods/{goods_id_for(q)}?from=market#tab=selling")
+            return
+        if url.path.startswith("/goods/"):
+            self._send_html(BUFF_GOODS_HTML)
+            return
+
+        # ---------------- 悠悠 ----------------
+        if url.path == "/market":
+            self._send_html(UU_MARKET_HTML)
+            return
+        if url.path == "/uu/search":
+            self._redirect(f"/goods-list?templateId={goods_id_for(q)}&keyword={quote(q)}")
+            return
+        if url.path == "/goods-list":
+            self._send_html(UU_GOODS_HTML)
+            return
+        if url.path == "/api/uu/commodity/list/sell":
+            if self._inject_failure(): return
+            template_id = query.get("templateId", ["0"])[0]
+            rows = []
+            for page_num in range(1, self.total_pages + 1):
+                rows += make_listings(template_id, page_num)
+            self._send_json({"Code": 0, "Data": {"CommodityList": [
+                {"Id": r["id"], "Price": r["price"], "Abrade": r["asset_info"]["paintwear"]} for r in rows
+            ]}})
+            return
+
+        self._send_json({"code": "Not Found", "path": html.escape(url.path)}, status=404)
+
+    def log_message(self, fmt, *args):
+        pass  # 安静模式
+
+
+def make_server(host=HOST, port=PORT, total_pages=TOTAL_PAGES, require_auth=False,
+                latency_ms=LATENCY_MS, fail_rate=FAIL_RATE, fail_status=FAIL_STATUS):
+    handler = type("Handler", (FixtureHandler,), {
+        "total_pages": total_pages,
+        "require_auth": require_auth,
+        "latency": latency_ms / 1000,
+        "fail_rate": fail_rate,
+        "fail_status": fail_status,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(**kwargs):
+    """后台线程启动，返回 (server, base_url)；用完调用 server.shutdown()"""
+    server = make_server(**kwargs)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def self_check(base_url):
+    """用真实客户端打一遍本地接口"""
+    from buff_api import BuffApiClient, BuffApiError
+
+    client = BuffApiClient(base_url=base_url)
+    items, total = client.fetch_sell_order("33960", 1)
+    print(f"✅ 第1页 {len(items)} 条, 共 {total} 页, 最低价 {items[0]['price']}")
+    items, _ = client.fetch_sell_order("33960", total + 1)
+    print(f"✅ 越界页 {len(items)} 条")
+    print(f"✅ 登录校验: {client.check_login()}")
+    client.close()
+
+    server, locked_url = start_in_thread(port=0, require_auth=True)
+    try:
+        anonymous = BuffApiClient(auth_file="__none__.json", base_url=locked_url)
+        print(f"✅ 未登录校验: {anonymous.check_login()}")
+        anonymous.fetch_sell_order("33960")
+        print("❌ 未登录应当报错")
+    except BuffApiError as e:
+        print(f"✅ 未登录识别: {e}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地假 BUFF / 悠悠 服务")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--pages", type=int, default=TOTAL_PAGES)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="每个请求的额外延迟")
+    parser.add_argument("--fail-rate", type=float, default=FAIL_RATE, help="接口随机失败的比例")
+    parser.add_argument("--fail-status", type=int, default=FAIL_STATUS, help="失败时的状态码 (503 / 429)")
+    parser.add_argument("--require-auth", action="store_true")
+    parser.add_argument("--check", action="store_true", help="启动后自检并退出")
+    args = parser.parse_args()
+
+    if args.check:
+        server, url = start_in_thread(host=args.host, port=0, total_pages=args.pages)
+        try:
+            self_check(url)
+        finally:
+            server.shutdown()
+    else:
+        server = make_server(args.host, args.port, args.pages, args.require_auth,
+                             args.latency_ms, args.fail_rate, args.fail_status)
+        print(f"🧪 假市场服务已启动: http://{args.host}:{args.port}  (Ctrl+C 退出)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,9 +1,9 @@
-from playwright.sync_api import sync_playwright
 import traceback
 
 def manual_login_youpin():
+    print("🚀 正在启动浏览器 (Edge)...")
+    from playwright.sync_api import sync_playwright  # 先有输出再加载 playwright，打包后双击不再干等
     with sync_playwright() as p:
-        print("🚀 正在启动浏览器 (Edge)...")
         # 【关键修改】加上 channel="msedge"
         browser = p.chromium.launch(channel="msedge", headless=False)
         
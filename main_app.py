@@ -2,26 +2,39 @@ import os
 # 设置 Playwright 环境变量，避免某些系统下报错
 os.environ["PLAYWRIGHT_BROWSERS_PATH"] = "0"
 
-import pandas as pd
+import sys
 import time
-import json
-import glob
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from email.utils import formataddr  # <---【关键新增】引入标准地址格式化工具
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import multiprocessing
 import traceback
 
-# 导入你的爬虫模块
-import buff_scraper
-import youpin_scraper
+# 只导入轻量模块；pandas / 爬虫 (requests、playwright) 在第一轮任务时才加载，exe 启动即有输出
+import browser_service
+import catalog
+import metrics
+import notifier
+import price_store
+import session_check
+import orderbook
+import pipeline
+import recipes
+import scheduler
+import sharding
+from snapshot import MarketSnapshot
 
 # ================= 文件路径配置 =================
 TASK_FILE = "task.xlsx"
-HISTORY_FILE = "price_history.json"
 CONFIG_FILE = "config.txt"
+RUN_CONCURRENT = True   # BUFF 与 YouPin 并行抓取 (False 则按顺序执行)
+KEEP_BROWSER_WARM = True  # 浏览器与登录态跨轮次常驻 (False 则每轮结束关闭)
+SCHEDULER_MODE = True   # 按紧迫度分批抓取 (False 则每小时全量抓一次)
+SCHEDULER_TICK = 600    # 调度模式下最长空等时间 (秒)，用于发现新增配方
+EXPORT_INTERVAL = 3600  # 调度模式下导出 BUFF_数据 / UU_数据 Excel 的间隔 (秒)，内容为各批累积的最新数据
+REPORT_INTERVAL = 3600  # 调度模式下无正期望时，汇总邮件最短间隔 (秒)
+SHARDED_MODE = False    # 每个市场拆成多个子进程 + 多账号并行抓取 (见 sharding.py)
+STREAM_ALERTS = True    # 每抓完一件就重算相关配方，越过阈值立即提醒 (见 pipeline.py)
 # ===============================================
 
 def load_email_config():
@@ -35,228 +48,228 @@ def load_email_config():
                     config[key.strip()] = val.strip()
     return config
 
-def get_item_categories():
-    """读取 task.xlsx 分组: A类(产出) vs B类(材料)"""
-    try:
-        df = pd.read_excel(TASK_FILE, header=None)
-        # A类: 第一行 (自动加磨损后缀)
-        row1 = df.iloc[0, 1:].dropna().astype(str).tolist()
-        group_a = [f"{t.strip()} (久经沙场)" for t in row1 if t.strip()]
-        # B类: 3-6行 (保持原样)
-        col2 = df.iloc[2:6, 1].dropna().astype(str).tolist()
-        group_b = [t.strip() for t in col2 if t.strip()]
-        return group_a, group_b
-    except Exception as e:
-        print(f"❌ 读取任务文件失败: {e}")
-        return [], []
-
-def get_latest_file(prefix):
-    """获取最新的数据文件"""
-    files = glob.glob(f"{prefix}*.xlsx")
-    if not files: return None
-    return max(files, key=os.path.getctime)
-
-def load_history():
-    """加载历史价格"""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except: return {}
-    return {}
-
-def save_history(data):
-    """保存当前价格"""
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
-def format_trend(current, last):
-    """生成带涨跌幅的价格显示 (HTML格式)"""
-    if last is None: return f"{current} (新)"
-    if last == 0: return str(current)
-    if current == 0: return "无货"
-    
-    diff = current - last
-    pct = (diff / last) * 100
-    
-    # 涨价红色，降价绿色
-    if diff > 0:
-        return f"{current} <span style='color:red; font-size:0.9em;'>(+{pct:.1f}%)</span>"
-    elif diff < 0:
-        return f"{current} <span style='color:green; font-size:0.9em;'>({pct:.1f}%)</span>"
-    else:
-        return str(current)
+# 各饰品最近一次抓到的挂单深度 (规范键 -> [各市场挂单])，调度模式下没抓的饰品沿用
+LADDER_CACHE = {}
+_last_report = 0.0
 
-def send_qq_email(df, config):
-    """发送 QQ 邮件 (标准修复版)"""
-    sender = config.get("SENDER_EMAIL")
-    password = config.get("SENDER_PASS")
-    receiver = config.get("RECEIVER_EMAIL")
+# 调度模式下各批结果累积成的完整快照 (市场 -> MarketSnapshot，每件取最近一次抓到的)，按 EXPORT_INTERVAL 导出
+EXPORT_SNAPSHOTS = {}
+_last_export = 0.0
 
-    if not sender or not password or not receiver:
-        print("⚠️ 邮箱配置不完整，跳过发送")
-        return
+def accumulate_export(snapshots):
+    """并入本批结果；到时间就把累积的完整快照导出 Excel (后台线程)"""
+    global _last_export
+    for market, snap in snapshots.items():
+        prev = EXPORT_SNAPSHOTS.get(market)
+        items = list(prev.items) if prev else []
+        stats = dict(prev.stats) if prev else {}
+        known = set(items)
+        for name in snap.items:
+            if name in snap.stale and name in stats: continue  # 本批没抓到，保留上次的数据
+            if name not in known:
+                items.append(name)
+                known.add(name)
+            stats[name] = snap.stats.get(name)
+        EXPORT_SNAPSHOTS[market] = MarketSnapshot(market, snap.file_prefix, items, stats)
+
+    if EXPORT_SNAPSHOTS and time.time() - _last_export >= EXPORT_INTERVAL:
+        for snap in EXPORT_SNAPSHOTS.values():
+            snap.timestamp = datetime.now()
+            snap.export_excel_async()
+        _last_export = time.time()
 
-    print("📧 正在发送 QQ 邮件...")
-    
-    # 生成 HTML 表格
-    html_table = df.to_html(escape=False, index=False, border=1, justify="center")
-    
-    msg = MIMEMultipart()
-    
-    # ===【核心修复】使用 formataddr 生成完全符合 RFC 标准的头部 ===
-    # 这解决了 "The 'From' header is missing or invalid" 问题
-    msg['From'] = formataddr((Header("CS2监控", 'utf-8').encode(), sender))
-    msg['To'] = formataddr((Header("Admin", 'utf-8').encode(), receiver))
-    # ========================================================
-    
-    msg['Subject'] = Header(f"行情监控 {datetime.now().strftime('%H:%M')}", 'utf-8')
-
-    body = f"""
-    <h3>CS2 炼金策略监控报告</h3>
-    <p><b>策略公式：</b> (A类价格 - B类最低价 × 5) / A类价格 > 15%</p>
-    <p><b>数据说明：</b> 价格取 Buff 与 悠悠有品 中的最低值。</p>
-    <hr>
-    {html_table}
-    <p style='font-size:12px; color:gray'>更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+def run_markets(only=None):
+    """
+    运行两个市场的爬虫，返回 {市场: MarketSnapshot} (只含成功的市场)。
+    两个站点、两个浏览器互不相干，并行时一轮耗时≈较慢的那个市场；
+    单个市场出错只影响它自己。
+    only: 可选的规范键集合，只抓这些饰品
     """
-    msg.attach(MIMEText(body, 'html', 'utf-8'))
+    import buff_scraper
+    import youpin_scraper
+
+    tasks = {
+        "BUFF": buff_scraper.main_task,
+        "YouPin": youpin_scraper.main_task,
+    }
+    if SHARDED_MODE:
+        tasks = {market: partial(sharding.main_task, market) for market in tasks}
+    else:
+        browser_service.begin_cycle()  # 两个市场都还没开始，可以安全地重启浏览器
+
+    # 调度模式的一批只是到期的部分饰品：不单独导出 Excel (否则同一小时的各批会互相覆盖该小时的文件)，
+    # 由 accumulate_export 累积后按小时导出
+    kwargs = {"only": only}
+    if only is not None:
+        kwargs["export_excel"] = False
+
+    def run_one(market):
+        print(f"🤖 运行 {market} 抓取...")
+        t0 = time.time()
+        with metrics.timer("market", market=market):
+            snapshot = tasks[market](**kwargs)
+        print(f"✅ {market} 抓取结束，用时 {time.time() - t0:.1f}s")
+        return snapshot
+
+    snapshots = {}
+    if RUN_CONCURRENT:
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="scraper") as pool:
+            futures = {market: pool.submit(run_one, market) for market in tasks}
+            for market, fut in futures.items():
+                try:
+                    snapshot = fut.result()
+                    if snapshot: snapshots[market] = snapshot
+                except Exception as e:
+                    print(f"❌ {market} 爬虫运行出错: {e}")
+                    traceback.print_exc()
+    else:
+        for market in tasks:
+            try:
+                snapshot = run_one(market)
+                if snapshot: snapshots[market] = snapshot
+            except Exception as e:
+                print(f"❌ {market} 爬虫运行出错: {e}")
+                traceback.print_exc()
+
+    if not KEEP_BROWSER_WARM:
+        browser_service.shutdown()
+    return snapshots
 
+def job(only=None):
+    """
+    抓取 + 计算 + 发信。only 为 None 时全量抓取；
+    返回 {规范键: 利润率与阈值的距离} 供调度器排期，失败返回 None
+    """
     try:
-        # QQ邮箱 SMTP 服务器
-        server = smtplib.SMTP_SSL("smtp.qq.com", 465)
-        server.login(sender, password)
-        server.sendmail(sender, [receiver], msg.as_string())
-        server.quit()
-        print("✅ 邮件发送成功！")
-    except Exception as e:
-        print(f"❌ 邮件发送失败: {e}")
+        with metrics.timer("cycle"):
+            return _job(only)
+    finally:
+        metrics.export()  # 每轮写 Prometheus 文件与 JSON 摘要
 
-def job():
+def _job(only):
+    global _last_report
+    import pandas as pd
+    import pricing
     print(f"\n⏰ === 新一轮任务: {datetime.now().strftime('%H:%M:%S')} ===")
-    
-    # 1. 运行爬虫模块
+    if only is not None:
+        print(f"📋 本批 {len(only)} 件到期饰品")
+
+    # 流式管道：每抓完一件就重算相关配方，越过阈值立即提醒
+    cat = catalog.get_catalog()
+    book = recipes.RecipeBook(recipes.load_recipes(), key=cat.key)
+    live = None
+    if STREAM_ALERTS and book.recipes:
+        live = pipeline.get_pipeline(notifier.get_notifier(load_email_config()).alert,
+                                     display=cat.display_name)
+        live.begin_cycle(book, cat.key, LADDER_CACHE)
+
+    # 1. 运行爬虫模块 (结果直接在内存中传递，不再读回 Excel)
     try:
-        print("🤖 运行 BUFF 抓取...")
-        buff_scraper.main_task()
-        print("🤖 运行 YouPin 抓取...")
-        youpin_scraper.main_task()
-    except Exception as e:
-        print(f"❌ 爬虫运行出错: {e}")
-        traceback.print_exc()
-        return
+        snapshots = run_markets(only)
+    finally:
+        if live: live.end_cycle()
 
-    # 2. 获取最新文件
-    f_buff = get_latest_file("BUFF_数据")
-    f_uu = get_latest_file("手套及其下级-uu")  # 注意：youpin_scraper.py 里生成的那个名字
-    
-    # 如果没找到，尝试模糊匹配（兼容不同的命名）
-    if not f_uu: 
-        f_uu = get_latest_file("UU_数据")
-    
-    if not f_buff or not f_uu:
-        print(f"❌ 未找到数据文件 (Buff: {f_buff}, UU: {f_uu})")
+    # 调度模式的各批不单独导出 Excel，累积后按小时导出完整数据
+    if only is not None:
+        accumulate_export(snapshots)
+
+    # 登录失效提醒 (各市场抓取前的预检产生，同一市场数小时内只发一次)
+    alerts = session_check.drain_alerts()
+    if alerts:
+        notifier.get_notifier(load_email_config()).alert(alerts)
+
+    if not snapshots:
+        print("❌ 两个市场均抓取失败，本轮跳过")
         return
 
-    # 3. 计算逻辑
+    # 2. 计算逻辑
     print("🧮 正在计算策略与趋势...")
     try:
-        df_buff = pd.read_excel(f_buff, index_col=0)
-        df_uu = pd.read_excel(f_uu, index_col=0)
+        # 写入价格库 (各市场完整统计行，只追加)
+        store = price_store.get_store()
+        for snap in snapshots.values():
+            store.append_snapshot(snap, key=cat.key)
+        cycle_ts = min(snap.timestamp for snap in snapshots.values()).timestamp()
 
-        # 确保有"最低"行
-        if "最低" not in df_buff.index or "最低" not in df_uu.index:
-            print("⚠️ 数据缺失'最低'行")
-            return
+        # 两个市场按规范键对齐，整列取最低 (不同写法的同一件会被合并)
+        fresh = pricing.combine_lowest(
+            {market: snap.lowest() for market, snap in snapshots.items()}, key=cat.key)
 
-        prices_buff = df_buff.loc["最低"]
-        prices_uu = df_uu.loc["最低"]
+        # 所有配方 (产出 / 材料 / 数量 / 阈值)，一次批量评估
+        if not book.recipes:
+            print("⚠️ 没有可用的配方，跳过计算")
+            return
 
-        # 合并取最低价
-        all_items = set(prices_buff.index).union(set(prices_uu.index))
-        combined_prices = {}
-        current_history = {} 
+        # 环比基准：价格库里本轮之前最近一次综合价 (一次批量查询)
+        keys = set(book.outputs["key"]) | set(book.inputs["key"])
+        last = pd.Series(store.last_values(keys, price_store.COMBINED, before=cycle_ts), dtype=float)
 
-        for item in all_items:
-            # 防止数据里有非数字
-            try:
-                p1 = float(prices_buff.get(item, 999999))
-            except: p1 = 999999
-            
-            try:
-                p2 = float(prices_uu.get(item, 999999))
-            except: p2 = 999999
-            
-            real_min = min(p1, p2)
-            if real_min == 999999: real_min = 0
-            
-            combined_prices[item] = real_min
-            current_history[item] = real_min
-
-        # 加载历史数据
-        history = load_history()
-        
-        # 获取 A/B 分组
-        group_a, group_b = get_item_categories()
+        # 本轮没抓 (调度未到期) 或没抓到 (熔断 / 失败) 的饰品沿用价格库里的最近价；
+        # 抓到了但无在售的保持 NaN，照常显示 "无货"
+        scraped = {cat.key(name) for snap in snapshots.values()
+                   for name in snap.items if name not in snap.stale}
+        stale = {cat.key(name) for snap in snapshots.values() for name in snap.stale} - scraped
+        if stale:
+            print(f"⚠️ {len(stale)} 件本轮无新数据，沿用上次价格")
+        combined = fresh[fresh.index.isin(scraped)].combine_first(last[~last.index.isin(scraped)])
 
-        # 找出 B类（材料）中最便宜的一个作为基准
-        b_prices = [combined_prices.get(b, 0) for b in group_b]
-        valid_b = [p for p in b_prices if p > 0]
-        min_b_cost = min(valid_b) if valid_b else 0
+        # 挂单深度：材料成本 = 两个市场合并吃单买够 N 件的最低总价
+        for snap in snapshots.values():
+            for name in snap.items:
+                LADDER_CACHE.pop(cat.key(name), None)
+        LADDER_CACHE.update(orderbook.group_ladders(snapshots.values(), cat.key))
 
-        report_data = []
+        with metrics.timer("compute"):
+            evaluated = book.evaluate(combined, LADDER_CACHE)
+            df_result = pricing.build_report(evaluated, last, display=cat.display_name)
 
-        # --- A类 (产出) ---
-        for a_item in group_a:
-            curr_p = combined_prices.get(a_item, 0)
-            trend_str = format_trend(curr_p, history.get(a_item))
-            
-            # 策略计算
-            status = "普通"
-            if curr_p > 0 and min_b_cost > 0:
-                cost = min_b_cost * 5
-                profit_rate = (curr_p - cost) / curr_p
-                
-                # 期望判定 > 15%
-                if profit_rate > 0.15:
-                    status = f"<b style='color:red'>🔥正期望 ({profit_rate:.1%})</b>"
-                else:
-                    status = f"利润率 {profit_rate:.1%}"
-            
-            report_data.append({
-                "类型": "产出 (A)",
-                "饰品名称": a_item.replace(" (久经沙场)", ""), # 简化名称显示
-                "最低价(环比)": trend_str,
-                "状态": status
-            })
-
-        # --- B类 (材料) ---
-        for b_item in group_b:
-            curr_p = combined_prices.get(b_item, 0)
-            trend_str = format_trend(curr_p, history.get(b_item))
-            
-            is_best = (curr_p == min_b_cost and curr_p > 0)
-            
-            report_data.append({
-                "类型": "材料 (B)",
-                "饰品名称": b_item,
-                "最低价(环比)": trend_str,
-                "状态": "<b style='color:blue'>最佳材料</b>" if is_best else "-"
-            })
+        # 保存本次综合价 (只存本轮真正抓到的)
+        store.append_prices(price_store.COMBINED, fresh.dropna().to_dict(), cycle_ts)
 
-        # 保存本次历史
-        save_history(current_history)
+        # 3. 发送报表 (调度模式下：出现正期望立即发，否则按 REPORT_INTERVAL 汇总)
+        #    后台通知线程发送，配方状态与上次报表相同的不重复发
+        out, inp, costs = evaluated
+        if only is None or out["profitable"].any() or time.time() - _last_report >= REPORT_INTERVAL:
+            notifier.get_notifier(load_email_config()).report(df_result, notifier.recipe_states(out, costs))
+            _last_report = time.time()
 
-        # 4. 发送邮件
-        df_result = pd.DataFrame(report_data)
-        email_config = load_email_config()
-        send_qq_email(df_result, email_config)
+        return scheduler.threshold_gaps(out, costs, inp)
 
     except Exception as e:
         print(f"❌ 计算流程出错: {e}")
         traceback.print_exc()
 
+def target_keys():
+    """当前全部配方涉及的规范键"""
+    cat = catalog.get_catalog()
+    book = recipes.RecipeBook(recipes.load_recipes(), key=cat.key)
+    return [cat.key(t["name"]) for t in book.targets()]
+
+def run_scheduled():
+    """调度循环：每次只抓到期的饰品，抓完按利润率离阈值远近和波动率重新排期"""
+    sched = scheduler.PollScheduler(target_keys())
+    while True:
+        for k in target_keys():
+            sched.add(k)  # 配方新增的饰品立即到期
+
+        due = sched.due_items()
+        if due:
+            gaps = job(only=set(due))
+            sched.reschedule(due, gaps or {})
+
+        nxt = sched.next_due()
+        wait = SCHEDULER_TICK if nxt is None else min(SCHEDULER_TICK, max(5, nxt - time.time()))
+        blocked = sched.budget_wait()
+        if blocked:
+            wait = max(5, blocked)  # 预算用完：睡到最早一次抓取滑出一小时窗口，不再每几秒空转
+        print(f"\n💤 挂机中... {wait / 60:.1f} 分钟后检查下一批")
+        time.sleep(wait)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后的 exe 启动分片子进程需要
+    if "--startup-check" in sys.argv:
+        # 基准测试时输出接管道：按行刷新，且不因控制台编码打印不了 emoji
+        sys.stdout.reconfigure(encoding="utf-8", line_buffering=True)
     try:
         # 检查配置
         if not os.path.exists(CONFIG_FILE):
@@ -271,7 +284,14 @@ if __name__ == "__main__":
              # raise FileNotFoundError("任务文件丢失")
 
         print("🚀 监控程序已启动 (按 Ctrl+C 退出)...")
-        
+        if "--startup-check" in sys.argv:
+            # 启动耗时基准 (startup_bench.py)：读完配方即退出，不抓取
+            print(f"✅ 启动检查通过：{len(recipes.load_recipes())} 个配方")
+            sys.exit(0)
+
+        if SCHEDULER_MODE:
+            run_scheduled()
+
         # 立即运行一次
         job()
         
@@ -288,4 +308,8 @@ if __name__ == "__main__":
         print("\n详细报错信息：")
         traceback.print_exc()
         print("!"*50 + "\n")
-        input(">>> 按回车键 (Enter) 退出程序...")
\ No newline at end of file
+        input(">>> 按回车键 (Enter) 退出程序...")
+    finally:
+        sharding.shutdown()
+        browser_service.shutdown()
+        notifier.shutdown()  # 发完还在攒的提醒
\ No newline at end of file
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+
+from stats_stream import P2Quantile
+
+# ================= 配置区 =================
+PROM_FILE = "scraper_metrics.prom"        # Prometheus textfile 格式 (node_exporter 可直接采集)
+SUMMARY_FILE = "metrics_summary.json"     # 本轮各阶段耗时摘要
+# 耗时分桶 (秒)：覆盖 0.3s 的接口间隔到 6s 的 expect_response 超时和整轮耗时
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 6, 8, 12, 20, 30, 60, 120, 300, 600)
+# =========================================
+
+
+class Histogram:
+    """固定分桶的耗时直方图，另带 P² 草图估计 P50/P95 (写 JSON 摘要用)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最后一格是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._p50 = P2Quantile(0.5)
+        self._p95 = P2Quantile(0.95)
+
+    def observe(self, v):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.count += 1
+        self.sum += v
+        if v > self.max: self.max = v
+        self._p50.add(v)
+        self._p95.add(v)
+
+    def merge(self, other):
+        """并入另一个直方图 (分桶相同)"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        if other.max > self.max: self.max = other.max
+        self._p50.merge(other._p50)
+        self._p95.merge(other._p95)
+
+    def cumulative(self):
+        """Prometheus 的 le 分桶是累计计数"""
+        total, out = 0, []
+        for c in self.counts:
+            total += c
+            out.append(total)
+        return out
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "p50": round(self._p50.value(), 3) if self.count else None,
+            "p95": round(self._p95.value(), 3) if self.count else None,
+            "max": round(self.max, 3),
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _label_text(key, extra=()):
+    parts = [f'{k}="{v}"' for k, v in list(key) + list(extra)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    各阶段耗时与事件计数，线程安全 (两个市场的爬虫线程和浏览器服务线程同时写)。
+    Prometheus 文件是进程启动以来的累计值；JSON 摘要只含本轮 (export 后清零)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}          # (stage, labels) -> Histogram，累计
+        self._counters = {}      # (event, labels) -> int，累计
+        self._cycle_hist = {}
+        self._cycle_counters = {}
+        self._cycle_start = time.time()
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            for table in (self._hist, self._cycle_hist):
+                h = table.get(key)
+                if h is None:
+                    h = table[key] = Histogram()
+                h.observe(seconds)
+
+    def inc(self, event, n=1, **labels):
+        key = (event, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+            self._cycle_counters[key] = self._cycle_counters.get(key, 0) + n
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """with metrics.timer("navigation", market="BUFF"): ... (异常也会计时)"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **labels)
+
+    # ---------------- 导出 ----------------
+    def prometheus_text(self):
+        lines = [
+            "# HELP scraper_stage_seconds Time spent per scraping/processing stage.",
+            "# TYPE scraper_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (stage, key), h in sorted(self._hist.items()):
+                labels = (("stage", stage),) + key
+                for le, c in zip(list(h.buckets) + ["+Inf"], h.cumulative()):
+                    lines.append(f"scraper_stage_seconds_bucket{_label_text(labels, [('le', le)])} {c}")
+                lines.append(f"scraper_stage_seconds_sum{_label_text(labels)} {h.sum:.6f}")
+                lines.append(f"scraper_stage_seconds_count{_label_text(labels)} {h.count}")
+
+            lines.append("# HELP scraper_events_total Timeouts, empty results, cache hits and other events.")
+            lines.append("# TYPE scraper_events_total counter")
+            for (event, key), n in sorted(self._counters.items()):
+                lines.append(f"scraper_events_total{_label_text((('event', event),) + key)} {n}")
+        return "\n".join(lines) + "\n"
+
+    def cycle_summary(self):
+        with self._lock:
+            stages = {}
+            for (stage, key), h in sorted(self._cycle_hist.items()):
+                name = stage + "".join(f"[{v}]" for _, v in key)
+                stages[name] = h.summary()
+            events = {event + "".join(f"[{v}]" for _, v in key): n
+                      for (event, key), n in sorted(self._cycle_counters.items())}
+        return {
+            "cycle_start": datetime.fromtimestamp(self._cycle_start).isoformat(timespec="seconds"),
+            "cycle_end": datetime.now().isoformat(timespec="seconds"),
+            "stages": stages,
+            "events": events,
+        }
+
+    def export(self, prom_file=PROM_FILE, summary_file=SUMMARY_FILE):
+        """写 Prometheus 文件与本轮 JSON 摘要 (先写临时文件再替换，采集端不会读到半个文件)"""
+        try:
+            _write_atomic(prom_file, self.prometheus_text())
+            _write_atomic(summary_file, json.dumps(self.cycle_summary(), ensure_ascii=False, indent=2))
+        except Exception as e:
+            print(f"⚠️ 指标导出失败: {e}")
+        self.reset_cycle()
+
+    def take_cycle(self):
+        """取出本轮数据并清零 (分片子进程每轮送回主进程用)：返回 (直方图表, 计数表)"""
+        with self._lock:
+            hist, counters = self._cycle_hist, self._cycle_counters
+            self._cycle_hist = {}
+            self._cycle_counters = {}
+        return hist, counters
+
+    def merge(self, hist, counters, **labels):
+        """并入 take_cycle() 的结果 (累计值与本轮都计入)，labels 追加到每一项上"""
+        extra = _label_key(labels)
+        relabel = lambda key: tuple(sorted(dict(key + extra).items()))
+        with self._lock:
+            for (stage, key), h in hist.items():
+                for table in (self._hist, self._cycle_hist):
+                    k = (stage, relabel(key))
+                    if k not in table:
+                        table[k] = Histogram(h.buckets)
+                    table[k].merge(h)
+            for (event, key), n in counters.items():
+                k = (event, relabel(key))
+                self._counters[k] = self._counters.get(k, 0) + n
+                self._cycle_counters[k] = self._cycle_counters.get(k, 0) + n
+
+    def reset_cycle(self):
+        """开始新一轮的 JSON 摘要统计 (累计值不受影响)"""
+        with self._lock:
+            self._cycle_hist = {}
+            self._cycle_counters = {}
+            self._cycle_start = time.time()
+
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# ---------------- 进程内单例 ----------------
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def timer(stage, **labels):
+    return get_metrics().timer(stage, **labels)
+
+
+def observe(stage, seconds, **labels):
+    get_metrics().observe(stage, seconds, **labels)
+
+
+def inc(event, n=1, **labels):
+    get_metrics().inc(event, n, **labels)
+
+
+def export():
+    get_metrics().export()
@@ -0,0 +1,157 @@
+"""
+浏览器请求白名单：每个市场只放行页面文档、渲染需要的脚本和列表 / 搜索接口，其余一律拦截。
+同时按轮统计拦截了多少请求、省下多少流量 (计费代理按流量收钱，每件饰品的页面越小越好)。
+
+- MODE 为 "strict" 走白名单；"light" 只拦图片 / 媒体 / 字体 (旧行为，默认)；"off" 不拦
+- strict 需手动开启：RULES 里的域名没有在真实页面上验证过，站点的脚本若放在 CDN 域名上，
+  strict 会把搜索 / 浏览器回退整个拦坏。开启后看每轮打印的 "被拦脚本域名"，把确认属于站点的 CDN 补进 hosts
+- 省下的流量按 EST_BYTES 估算 (被拦的请求根本没下载，拿不到真实大小)；实际下载量按 Content-Length 统计
+"""
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import metrics
+
+# ================= 配置区 =================
+MODE = {"BUFF": "light", "YouPin": "light"}   # 验证过 RULES 后可改为 "strict"
+
+# hosts: 站点自己的域名 (后缀匹配，base_url 的域名自动加入)，只有这些域名的文档 / 脚本 / 接口会放行
+# api:   放行的 XHR / fetch 地址片段 (列表接口、搜索联想、登录信息)
+RULES = {
+    "BUFF": {
+        "hosts": ("buff.163.com",),
+        "types": ("document", "script"),
+        "api": ("/api/market/goods/sell_order", "/api/market/search", "/account/api/"),
+    },
+    "YouPin": {
+        "hosts": ("youpin898.com",),
+        "types": ("document", "script"),
+        "api": ("/commodity/list/sell", "queryOnSaleCommodityList", "search", "Search", "/user/"),
+    },
+}
+LIGHT_BLOCK = ("image", "media", "font")
+API_TYPES = ("xhr", "fetch")
+
+# 被拦请求的估算大小 (字节)
+EST_BYTES = {
+    "image": 30_000, "media": 200_000, "font": 40_000, "stylesheet": 25_000,
+    "script": 60_000, "xhr": 3_000, "fetch": 3_000, "document": 30_000,
+}
+EST_BYTES_OTHER = 2_000
+TOP_BLOCKED_HOSTS = 3   # 每轮打印被拦最多的几个脚本 / 接口域名
+# =========================================
+
+
+def _host_allowed(host, hosts):
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+
+class RequestFilter:
+    """一个市场的路由规则与本轮计数 (路由回调在浏览器服务线程，汇总在爬虫线程，加锁)"""
+
+    def __init__(self, market, base_url=None, extra_api=()):
+        self.market = market
+        self.mode = MODE.get(market, "light")
+        rule = RULES[market]
+        hosts = list(rule["hosts"])
+        if base_url:
+            hosts.append(urlparse(base_url).hostname)
+        self.hosts = tuple(h for h in hosts if h)
+        self.types = tuple(rule["types"])
+        self.api = tuple(rule["api"]) + tuple(extra_api)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.allowed = 0
+        self.blocked = Counter()        # 资源类型 -> 次数
+        self.blocked_hosts = Counter()  # 被拦的脚本 / 接口域名 -> 次数
+        self.saved_bytes = 0
+        self.downloaded_bytes = 0
+
+    def allows(self, request):
+        kind = request.resource_type
+        if self.mode == "off": return True
+        if self.mode == "light": return kind not in LIGHT_BLOCK
+
+        if kind == "document" and request.is_navigation_request() and request.frame.parent_frame is None:
+            return True  # 主框架导航 (含登录 / 验证码跳转) 一律放行，由页面逻辑判断
+        host = urlparse(request.url).hostname or ""
+        if not _host_allowed(host, self.hosts): return False
+        if kind in self.types: return True
+        if kind in API_TYPES: return any(p in request.url for p in self.api)
+        return False
+
+    async def handle(self, route):
+        request = route.request
+        if self.allows(request):
+            with self._lock:
+                self.allowed += 1
+            await route.continue_()
+            return
+
+        kind = request.resource_type
+        with self._lock:
+            self.blocked[kind] += 1
+            self.saved_bytes += EST_BYTES.get(kind, EST_BYTES_OTHER)
+            if kind in ("script",) + API_TYPES:
+                self.blocked_hosts[urlparse(request.url).hostname or "?"] += 1
+        await route.abort()
+
+    def on_response(self, response):
+        try:
+            size = int(response.headers.get("content-length", 0))
+        except ValueError:
+            return
+        with self._lock:
+            self.downloaded_bytes += size
+
+    def cycle_report(self, items=0):
+        """打印并写入指标，然后清零本轮计数；items 为本轮抓取的饰品数 (用于算每件流量)"""
+        with self._lock:
+            allowed, blocked, hosts = self.allowed, self.blocked, self.blocked_hosts
+            saved, downloaded = self.saved_bytes, self.downloaded_bytes
+            self._reset()
+        total_blocked = sum(blocked.values())
+        if not allowed and not total_blocked: return
+
+        metrics.inc("net_allowed", allowed, market=self.market)
+        for kind, n in blocked.items():
+            metrics.inc("net_blocked", n, market=self.market, type=kind)
+        metrics.inc("net_bytes_saved", saved, market=self.market)
+        metrics.inc("net_bytes", downloaded, market=self.market)
+
+        per_item = f"，每件 {downloaded / items / 1024:.0f}KB" if items else ""
+        print(f"🧹 [{self.market}] 放行 {allowed} 个请求 (下载 {downloaded / 1024 / 1024:.1f}MB{per_item})，"
+              f"拦截 {total_blocked} 个 (约省 {saved / 1024 / 1024:.1f}MB)")
+        if hosts:
+            top = ", ".join(f"{h}×{n}" for h, n in hosts.most_common(TOP_BLOCKED_HOSTS))
+            print(f"   被拦脚本 / 接口域名: {top}")
+
+
+async def install(context, market, base_url=None, extra_api=()):
+    """给 context 装上路由 (在 browser_service.acquire 的 setup 里调用)，返回该市场的过滤器"""
+    flt = get_filter(market, base_url, extra_api)
+    if flt.mode != "off":
+        await context.route("**/*", flt.handle)
+    context.on("response", flt.on_response)
+    return flt
+
+
+def cycle_report(market, items=0):
+    """本轮浏览器没启用过 (如 BUFF 全走直连接口) 时什么都不做"""
+    flt = _filters.get(market)
+    if flt: flt.cycle_report(items)
+
+
+# ---------------- 进程内单例 ----------------
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def get_filter(market, base_url=None, extra_api=()):
+    with _filters_lock:
+        if market not in _filters:
+            _filters[market] = RequestFilter(market, base_url, extra_api)
+        return _filters[market]
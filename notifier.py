@@ -0,0 +1,387 @@
+"""
+通知子系统：后台线程发送，爬虫 / 计算线程只负责把消息放进队列。
+
+- SMTP 连接常驻复用 (空闲 SMTP_IDLE_CLOSE 秒后关闭，断线自动重连一次)，不再每封邮件重新握手登录
+- 去重：汇总报表只在某个配方的状态 (哪些产出正期望) 变化时发送，状态不变时最多每 REPORT_HEARTBEAT 发一次；
+  带 key 的提醒与上次状态相同则不发
+- 提醒攒 DIGEST_WINDOW 秒合成一封摘要
+- 除邮件外可同时发到本地 webhook (POST JSON) 或文件 (JSON Lines)
+
+config.txt 里可选的键：
+    SMTP_HOST / SMTP_PORT / SMTP_SSL    默认 smtp.qq.com / 465 / 1；本地测试可指向 aiosmtpd (SSL=0，无需密码)
+    NOTIFY_WEBHOOK                      webhook 地址
+    NOTIFY_FILE                         通知落盘文件
+
+用法:
+    python notifier.py --check          # 起一个本地 aiosmtpd (需 pip install aiosmtpd) 自检一遍
+"""
+from collections import namedtuple
+from datetime import datetime
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+import json
+import queue
+import smtplib
+import threading
+import time
+
+import metrics
+
+# ================= 配置区 =================
+SMTP_HOST = "smtp.qq.com"
+SMTP_PORT = 465
+SMTP_SSL = True
+SMTP_TIMEOUT = 15
+SMTP_IDLE_CLOSE = 240        # 连接空闲多久主动关闭 (QQ 邮箱几分钟不发信会断开)
+DIGEST_WINDOW = 15           # 提醒攒多久合成一封 (秒)
+DIGEST_MAX = 20              # 攒够多少条立即发
+REPORT_HEARTBEAT = 6 * 3600  # 配方状态一直不变时，汇总报表最长间隔 (秒)
+WEBHOOK_TIMEOUT = 5
+FLUSH_TIMEOUT = 30           # 退出时等待剩余消息发完的上限 (秒)
+# =========================================
+
+# 一条待发消息：kind 为 "report" / "digest"；lines 为纯文本行 (webhook / 文件用)
+Notification = namedtuple("Notification", ["kind", "subject", "html", "lines", "ts"])
+
+
+def _footer(note=""):
+    return (f"<p style='font-size:12px; color:gray'>时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            f"{note}</p>")
+
+
+# ---------------- 输出端 ----------------
+class SmtpSink:
+    """常驻 SMTP 连接；只在通知线程里使用，不需要加锁"""
+
+    name = "smtp"
+
+    def __init__(self, sender, password, receiver, host=SMTP_HOST, port=SMTP_PORT, ssl=SMTP_SSL):
+        self.sender = sender
+        self.password = password
+        self.receiver = receiver
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self._conn = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        cls = smtplib.SMTP_SSL if self.ssl else smtplib.SMTP
+        conn = cls(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.password:
+            conn.login(self.sender, self.password)
+        metrics.inc("smtp_connect")
+        return conn
+
+    def send(self, note):
+        msg = MIMEMultipart()
+        # 使用 formataddr 生成符合 RFC 标准的头部 (否则 QQ 邮箱报 "The 'From' header is missing or invalid")
+        msg['From'] = formataddr((Header("CS2监控", 'utf-8').encode(), self.sender))
+        msg['To'] = formataddr((Header("Admin", 'utf-8').encode(), self.receiver))
+        msg['Subject'] = Header(note.subject, 'utf-8')
+        msg.attach(MIMEText(note.html, 'html', 'utf-8'))
+
+        with metrics.timer("smtp"):
+            for attempt in range(2):
+                if self._conn is None:
+                    self._conn = self._connect()
+                try:
+                    self._conn.sendmail(self.sender, [self.receiver], msg.as_string())
+                    break
+                except OSError:  # 含 SMTPException：多半是服务器断开了空闲连接，重连一次
+                    self.close()
+                    if attempt: raise
+        self._last_used = time.monotonic()
+
+    def idle(self):
+        if self._conn is not None and time.monotonic() - self._last_used > SMTP_IDLE_CLOSE:
+            self.close()
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None: return
+        try:
+            conn.quit()
+        except Exception: pass
+
+
+class WebhookSink:
+    """POST JSON：{"kind", "subject", "lines", "ts"}"""
+
+    name = "webhook"
+
+    def __init__(self, url):
+        import requests  # 只有配置了 webhook 才需要
+        self.url = url
+        self._session = requests.Session()
+
+    def send(self, note):
+        resp = self._session.post(self.url, timeout=WEBHOOK_TIMEOUT, json={
+            "kind": note.kind, "subject": note.subject, "lines": note.lines, "ts": note.ts})
+        resp.raise_for_status()
+
+    def idle(self): pass
+
+    def close(self):
+        self._session.close()
+
+
+class FileSink:
+    """每条通知追加一行 JSON"""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, note):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"kind": note.kind, "subject": note.subject,
+                                "lines": note.lines, "ts": note.ts}, ensure_ascii=False) + "\n")
+
+    def idle(self): pass
+
+    def close(self): pass
+
+
+def sinks_from_config(config):
+    """按 config.txt 组装输出端；邮箱配置不完整时不发邮件"""
+    sinks = []
+    sender, receiver = config.get("SENDER_EMAIL"), config.get("RECEIVER_EMAIL")
+    host = config.get("SMTP_HOST") or SMTP_HOST
+    password = config.get("SENDER_PASS")
+    # 本地 SMTP 测试服务 (指定了 SMTP_HOST) 可以不需要密码
+    if sender and receiver and (password or config.get("SMTP_HOST")):
+        sinks.append(SmtpSink(sender, password, receiver, host,
+                              int(config.get("SMTP_PORT") or SMTP_PORT),
+                              config.get("SMTP_SSL", "1" if SMTP_SSL else "0") not in ("0", "false", "False")))
+    if config.get("NOTIFY_WEBHOOK"):
+        sinks.append(WebhookSink(config["NOTIFY_WEBHOOK"]))
+    if config.get("NOTIFY_FILE"):
+        sinks.append(FileSink(config["NOTIFY_FILE"]))
+    if not sinks:
+        print("⚠️ 邮箱配置不完整且未配置其它通知方式，通知将不会发送")
+    return sinks
+
+
+# ---------------- 调度 ----------------
+class Notifier:
+    """
+    report() / alert() 只入队，立即返回；通知线程负责去重、攒摘要和发送。
+    去重状态只在通知线程里读写。
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.queue = queue.Queue()
+        self._report_states = None   # 上次发出的报表对应的配方状态
+        self._last_report = 0.0
+        self._alert_states = {}      # 提醒 key -> 上次状态
+        self._pending = []           # 待合并的提醒行
+        self._pending_since = None
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+
+    # ---------------- 调用方 ----------------
+    def report(self, df, states, force=False):
+        """
+        汇总报表。states: {配方: 正期望产出集合}，与上次发出的相同则不发 (超过 REPORT_HEARTBEAT 除外)
+        force: 不做去重 (如手动要求立即发)
+        """
+        self.queue.put(("report", df, states, force))
+
+    def alert(self, lines, key=None, state=None):
+        """提醒；给了 key 时与该 key 上次的 state 相同则丢弃"""
+        self.queue.put(("alert", list(lines), key, state))
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """等队列发完 (包括还在攒的摘要)；退出前调用"""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+    # ---------------- 通知线程 ----------------
+    def _run(self):
+        while True:
+            try:
+                event = self.queue.get(timeout=self._wait_time())
+            except queue.Empty:
+                event = ()
+            if event is None: break
+            try:
+                self._handle(event)
+            except Exception as e:
+                print(f"❌ [通知] 处理出错: {e}")
+            if self._pending and (len(self._pending) >= DIGEST_MAX
+                                  or time.monotonic() - self._pending_since >= DIGEST_WINDOW):
+                self._send_digest()
+            for sink in self.sinks:
+                sink.idle()
+        for sink in self.sinks:
+            sink.close()
+
+    def _wait_time(self):
+        if not self._pending: return SMTP_IDLE_CLOSE
+        return max(0.05, DIGEST_WINDOW - (time.monotonic() - self._pending_since))
+
+    def _handle(self, event):
+        if not event: return
+        kind = event[0]
+        if kind == "alert":
+            _, lines, key, state = event
+            if key is not None:
+                if self._alert_states.get(key) == state:
+                    metrics.inc("notify_suppressed", kind="alert")
+                    return
+                self._alert_states[key] = state
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.extend(lines)
+        elif kind == "report":
+            _, df, states, force = event
+            self._send_report(df, states, force)
+        elif kind == "flush":
+            if self._pending: self._send_digest()
+            event[1].set()
+
+    def _send_report(self, df, states, force):
+        unchanged = states == self._report_states
+        if unchanged and not force and time.time() - self._last_report < REPORT_HEARTBEAT:
+            print("📭 [通知] 配方状态与上次报表相同，本次不发")
+            metrics.inc("notify_suppressed", kind="report")
+            return
+        # 摘要里还没发的提醒并进报表一起发
+        pending, self._pending = self._pending, []
+        html_table = df.to_html(escape=False, index=False, border=1, justify="center")
+        alerts = "".join(f"<li>{line}</li>" for line in pending)
+        html = f"""
+    <h3>CS2 炼金策略监控报告</h3>
+    {f"<ul>{alerts}</ul>" if alerts else ""}
+    <p><b>策略公式：</b> (A类价格 - 买够 N 个B类材料的最低总价) / A类价格 > 配方阈值 (默认 5 个、15%)</p>
+    <p><b>数据说明：</b> 价格取 Buff 与 悠悠有品 中的最低值。</p>
+    <hr>
+    {html_table}
+    {_footer("" if not unchanged else "，配方状态无变化 (定期汇总)")}
+    """
+        lines = pending + [f"{r}: {', '.join(sorted(s)) or '无正期望'}" for r, s in (states or {}).items()]
+        note = Notification("report", f"行情监控 {datetime.now().strftime('%H:%M')}", html, lines, time.time())
+        if not self._dispatch(note) and self.sinks:
+            # 全部输出端都失败：不记去重状态 (下次相同的报表照发)，并入的提醒放回摘要
+            if pending:
+                self._pending = pending + self._pending
+                self._pending_since = time.monotonic()
+            return
+        self._report_states = states
+        self._last_report = time.time()
+
+    def _send_digest(self):
+        lines, self._pending = self._pending, []
+        items = "".join(f"<li>{line}</li>" for line in lines)
+        html = f"""
+    <h3>CS2 监控提醒 ({len(lines)} 条)</h3>
+    <ul>{items}</ul>
+    {_footer()}
+    """
+        subject = f"🔥 监控提醒 {datetime.now().strftime('%H:%M')}" if any("🔥" in l for l in lines) \
+            else f"⚠️ 监控提醒 {datetime.now().strftime('%H:%M')}"
+        self._dispatch(Notification("digest", subject, html, lines, time.time()))
+
+    def _dispatch(self, note):
+        """发到所有输出端，返回成功的个数"""
+        sent = 0
+        for sink in self.sinks:
+            try:
+                sink.send(note)
+                sent += 1
+                metrics.inc("notify_sent", sink=sink.name, kind=note.kind)
+                print(f"✅ [通知] {sink.name} 已发送: {note.subject}")
+            except Exception as e:
+                metrics.inc("notify_failed", sink=sink.name, kind=note.kind)
+                print(f"❌ [通知] {sink.name} 发送失败: {e}")
+        return sent
+
+
+def recipe_states(out, costs):
+    """RecipeBook.evaluate() 结果 -> {配方名: 正期望产出键的 frozenset}，用于报表去重"""
+    names = costs["配方"].to_numpy()
+    states = {name: set() for name in names}
+    for recipe, key in out.loc[out["profitable"], ["recipe", "key"]].itertuples(index=False):
+        states[names[int(recipe)]].add(key)
+    return {name: frozenset(keys) for name, keys in states.items()}
+
+
+# ---------------- 进程内单例 ----------------
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier(config):
+    """第一次调用时按 config 建立输出端 (修改 config.txt 后需重启生效)"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = Notifier(sinks_from_config(config))
+        return _notifier
+
+
+def shutdown():
+    global _notifier
+    with _notifier_lock:
+        if _notifier is not None:
+            _notifier.close()
+        _notifier = None
+
+
+def self_check():
+    """本地 aiosmtpd 收信，验证连接复用、去重与摘要"""
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+    except ImportError:
+        print("❌ 需要 aiosmtpd: pip install aiosmtpd")
+        return
+
+    received = []
+
+    class Handler(Sink):
+        async def handle_DATA(self, server, session, envelope):
+            received.append(envelope.content)
+            return "250 OK"
+
+    # Controller 启动时要连自己的端口确认就绪，不能传 port=0，先找一个空闲端口
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    controller = Controller(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        import pandas as pd
+        notifier = Notifier(sinks_from_config({"SENDER_EMAIL": "bot@localhost", "RECEIVER_EMAIL": "me@localhost",
+                                               "SMTP_HOST": "127.0.0.1", "SMTP_PORT": port, "SMTP_SSL": "0"}))
+        df = pd.DataFrame({"配方": ["测试"], "状态": ["普通"]})
+        notifier.alert(["提醒 1"], key="a", state=True)
+        notifier.alert(["提醒 1 (重复)"], key="a", state=True)
+        notifier.alert(["提醒 2"])
+        notifier.report(df, {"测试": frozenset()})
+        notifier.report(df, {"测试": frozenset()})
+        notifier.close()
+        connects = metrics.get_metrics().cycle_summary()["events"].get("smtp_connect", 0)
+        print(f"✅ 收到 {len(received)} 封 (应为 1：未发的提醒并入报表)，SMTP 建连 {connects} 次 (应为 1)")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="通知子系统")
+    parser.add_argument("--check", action="store_true", help="用本地 aiosmtpd 自检")
+    if parser.parse_args().check:
+        self_check()
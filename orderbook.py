@@ -0,0 +1,42 @@
+import heapq
+from collections import namedtuple
+
+# 一条在售挂单：价格、数量 (一般为 1)、磨损值 (拿不到为 None)、市场
+Ask = namedtuple("Ask", ["price", "qty", "wear", "market"])
+
+
+def make_ladder(asks):
+    """按价格升序排好的挂单列表 (丢掉无效价格)"""
+    return sorted((a for a in asks if a.price and a.price > 0), key=lambda a: a.price)
+
+
+def ladder_units(ladder):
+    return sum(a.qty for a in ladder)
+
+
+def fill_cost(ladders, n):
+    """
+    在多个市场的挂单里凑够 n 件的最低总价 (k 路堆归并，按价格从低到高吃单)
+    ladders: 若干条已按价格升序的挂单列表 (如 BUFF 一条、悠悠一条)
+    返回 (总价, 实际凑到的件数, 吃掉的挂单列表)；深度不够时总价为 None
+    """
+    if n <= 0: return 0.0, 0, []
+    total, filled, picks = 0.0, 0, []
+    for ask in heapq.merge(*ladders, key=lambda a: a.price):
+        take = min(ask.qty, n - filled)
+        total += ask.price * take
+        filled += take
+        picks.append(ask)
+        if filled >= n:
+            return round(total, 2), filled, picks
+    return None, filled, picks
+
+
+def group_ladders(snapshots, key):
+    """把各市场快照的挂单按规范键归到一起：{键: [BUFF 挂单, 悠悠挂单, ...]}"""
+    ladders = {}
+    for snap in snapshots:
+        for name, ladder in snap.ladders.items():
+            if ladder:
+                ladders.setdefault(key(name), []).append(ladder)
+    return ladders
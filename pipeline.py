@@ -0,0 +1,164 @@
+"""
+流式管道：两个市场每抓完一件就把结果推进队列，后台消费线程
+  1. 增量更新该件的综合最低价 (只取本轮抓到的市场；本轮还没抓到的饰品沿用价格库里最近的综合价，与批量计算一致)
+  2. 只重算用到这件饰品的配方
+  3. 配方刚越过阈值就立即提醒，不等整轮结束
+提醒延迟取决于这件饰品什么时候被抓到，而不是整轮多长。整轮结束后 main_app.job 照常批量计算并发汇总邮件。
+"""
+import queue
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import metrics
+import price_store
+
+# ================= 配置区 =================
+DRAIN_TIMEOUT = 60    # 整轮结束后等待队列处理完的上限 (秒)
+# =========================================
+
+# 一件饰品在一个市场的抓取结果
+ItemResult = namedtuple("ItemResult", ["market", "name", "stats", "ladder", "ts"])
+NAN = float("nan")
+
+
+class LivePipeline:
+    """
+    单消费线程，状态只在该线程里改 (begin_cycle 在队列空闲时调用)。
+    已提醒过的 (配方, 产出) 跨轮次记住，利润率回落到阈值以下后才会再次提醒。
+    """
+
+    def __init__(self, on_alert, display=str):
+        self.on_alert = on_alert      # on_alert([提醒文本, ...])
+        self.display = display
+        self.queue = queue.Queue()
+        self.book = None
+        self.key = None
+        self.market_prices = {}       # 市场 -> {规范键: 本轮最低价}
+        self.ladders = {}             # 规范键 -> {市场: 挂单列表}
+        self.prices = {}              # 规范键 -> 综合最低价
+        self.fresh = set()            # 本轮已有市场抓到的规范键
+        self.alerted = set()          # (配方名, 产出键)；用名字而不是序号，配方增删 / 调整顺序后仍然有效
+        self._thread = threading.Thread(target=self._run, name="pipeline", daemon=True)
+        self._thread.start()
+
+    # ---------------- 主线程 ----------------
+    def begin_cycle(self, book, key, ladders=None):
+        """
+        每轮抓取前调用：装入配方索引，基准价取价格库里最近的综合价 (与 main_app.job 的环比基准相同)。
+        某件饰品本轮第一次被抓到时，丢掉它的基准价和旧挂单，只用本轮抓到的市场，
+        这样没跑的市场 (登录失效 / 熔断) 的旧数据不会触发提醒，与整轮结束后的批量计算一致。
+        ladders: 上一轮的挂单缓存 {规范键: [各市场挂单列表]} (main_app.LADDER_CACHE)
+        """
+        self.queue.join()
+        store = price_store.get_store()
+        keys = set(book.by_key)
+        last = store.last_values(keys, price_store.COMBINED)
+        self.market_prices = {}
+        self.fresh = set()
+        self.ladders = {}
+        for k, lads in (ladders or {}).items():
+            for lad in lads:
+                if lad: self.ladders.setdefault(k, {})[lad[0].market] = lad
+        self.key = key
+        self.prices = {k: last.get(k) or NAN for k in keys}
+        self.book = book
+
+    def publish(self, market, name, stats, ladder):
+        if self.book is None or stats is None: return
+        self.queue.put(ItemResult(market, name, stats, ladder, time.time()))
+
+    def end_cycle(self, timeout=DRAIN_TIMEOUT):
+        """等队列里剩下的结果处理完，之后不再接收本轮结果"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.book = None
+
+    # ---------------- 消费线程 ----------------
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                with metrics.timer("stream_eval", market=item.market):
+                    self._handle(item)
+            except Exception as e:
+                print(f"❌ [流式] 处理 {item.name} 出错: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _combined(self, k):
+        values = [p[k] for p in self.market_prices.values() if p.get(k)]
+        return min(values) if values else NAN  # 本轮抓到但无在售：NaN (报表里的 "无货")
+
+    def _handle(self, item):
+        book = self.book
+        if book is None: return
+        k = self.key(item.name)
+        if k not in self.prices or item.stats is None: return
+
+        if k not in self.fresh:
+            self.fresh.add(k)
+            self.ladders.pop(k, None)
+        low = item.stats.get("最低")
+        self.market_prices.setdefault(item.market, {})[k] = low or None  # 0 = 无在售
+        if item.ladder:
+            self.ladders.setdefault(k, {})[item.market] = item.ladder
+        else:
+            self.ladders.get(k, {}).pop(item.market, None)
+        self.prices[k] = self._combined(k)
+
+        alerts = []
+        for i in book.recipes_using(k):
+            r = book.recipes[i]
+            ladders = {self.key(n): list(self.ladders.get(self.key(n), {}).values()) for n in r.inputs}
+            for out_key, out_name, price, cost, rate, profitable in book.evaluate_recipe(i, self.prices, ladders):
+                tag = (r.name, out_key)
+                if profitable and tag not in self.alerted:
+                    self.alerted.add(tag)
+                    alerts.append(f"🔥 {r.name}：{self.display(out_name)} 售价 {price:.2f}，"
+                                  f"材料成本 {cost:.2f}，利润率 {rate:.1%} (阈值 {r.threshold:.0%})，"
+                                  f"由 {item.market} 的 {self.display(item.name)} 触发")
+                elif not profitable and rate == rate:
+                    self.alerted.discard(tag)  # 回落到阈值以下 (有价格时才算)，下次越线再提醒
+
+        if alerts:
+            metrics.observe("time_to_alert", time.time() - item.ts, market=item.market)
+            metrics.inc("stream_alert", len(alerts), market=item.market)
+            for line in alerts:
+                print(f"\n{line}")
+            self.on_alert(alerts)
+
+
+# ---------------- 进程内单例 ----------------
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline(on_alert=None, display=str):
+    """第一次调用时创建 (需要 on_alert)，之后返回同一个"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None and on_alert is not None:
+            _pipeline = LivePipeline(on_alert, display)
+        return _pipeline
+
+
+def publish(market, name, stats, ladder):
+    """爬虫每抓完一件调用；没启用流式管道 (或本轮未开始) 时什么都不做"""
+    if _pipeline is not None:
+        _pipeline.publish(market, name, stats, ladder)
+
+
+@contextmanager
+def item(market, name, stats, ladders, stale):
+    """
+    with pipeline.item("BUFF", 名称, final_stats, final_ladders, stale): ...
+    块结束时 (含 continue) 把这件的结果推进管道；失败 / 熔断跳过的不推
+    """
+    try:
+        yield
+    finally:
+        if stats.get(name) is not None and name not in stale:
+            publish(market, name, stats[name], ladders.get(name))
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import catalog
+
+# ================= 配置区 =================
+STORE_FILE = "price_store.db"            # 追加写入的价格时间序列
+LEGACY_HISTORY_FILE = "price_history.json"
+COMBINED = "COMBINED"                    # 两个市场取最低后的综合价
+# =========================================
+
+# 主键 (item, market, ts) 本身就是按时间排序的 B 树索引，
+# "最新值 / N 小时前 / 窗口最小值" 都是一次范围查找
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    item    TEXT NOT NULL,   -- 目录规范键 (catalog.normalize_name)
+    market  TEXT NOT NULL,   -- BUFF / YouPin / COMBINED
+    ts      REAL NOT NULL,   -- unix 时间戳 (秒)
+    lowest  REAL,
+    highest REAL,
+    mean    REAL,
+    median  REAL,
+    stats   TEXT,            -- 完整统计行 (JSON)，便于以后扩展指标
+    PRIMARY KEY (item, market, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_prices_ts ON prices (ts);
+"""
+
+_FIELDS = {"lowest": "最低", "highest": "最高", "mean": "均值", "median": "中位数"}
+
+
+def _num(v):
+    """0 / "-" / None 都视为无价格"""
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return v if v > 0 else None
+
+
+class PriceStore:
+    """
+    只追加的本地价格库 (SQLite)。
+    每轮把各市场的完整统计行写进来，历史永远保留；
+    趋势、涨跌幅、窗口最低价都通过带索引的查询获得。
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        is_new = not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        if is_new:
+            self._import_legacy()
+
+    def _import_legacy(self):
+        """旧版 price_history.json 只有上一轮的综合价，导入为一条历史"""
+        if not os.path.exists(LEGACY_HISTORY_FILE): return
+        try:
+            with open(LEGACY_HISTORY_FILE, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except: return
+
+        ts = os.path.getmtime(LEGACY_HISTORY_FILE)
+        prices = {catalog.normalize_name(name): p for name, p in history.items()}
+        self.append_prices(COMBINED, prices, ts)
+        print(f"📚 已导入旧历史 {len(prices)} 条 -> {self.path}")
+
+    # ---------------- 写入 ----------------
+    def append_rows(self, rows):
+        """rows: [(item, market, ts, stats_dict), ...]"""
+        data = []
+        for item, market, ts, stats in rows:
+            data.append((
+                item, market, ts,
+                *(_num(stats.get(cn)) for cn in _FIELDS.values()),
+                json.dumps(stats, ensure_ascii=False),
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO prices (item, market, ts, lowest, highest, mean, median, stats) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", data)
+
+    def append_snapshot(self, snapshot, key=None):
+        """写入一个市场的 MarketSnapshot；key 把饰品名映射为规范键"""
+        ts = snapshot.timestamp.timestamp()
+        rows = []
+        for name in snapshot.items:
+            stats = snapshot.stats.get(name)
+            if stats:
+                rows.append((key(name) if key else name, snapshot.market, ts, stats))
+        self.append_rows(rows)
+
+    def append_prices(self, market, prices, ts=None):
+        """只有最低价的写入 (如综合价)：{item: price}"""
+        ts = ts or time.time()
+        self.append_rows([(item, market, ts, {"最低": p}) for item, p in prices.items()])
+
+    # ---------------- 查询 ----------------
+    def _one(self, sql, args):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()
+
+    def last_value(self, item, market=COMBINED, before=None, field="lowest"):
+        """最近一次 (ts < before) 的有效值，返回 (ts, value) 或 None"""
+        col = _column(field)
+        before = before if before is not None else float("inf")
+        row = self._one(
+            f"SELECT ts, {col} FROM prices WHERE item = ? AND market = ? AND ts < ? AND {col} IS NOT NULL "
+            "ORDER BY ts DESC LIMIT 1", (item, market, before))
+        return tuple(row) if row else None
+
+    def last_values(self, items, market=COMBINED, before=None, field="lowest"):
+        """批量版 last_value：返回 {item: value}，一次查询取回所有饰品"""
+        col = _column(field)
+        items = list(items)
+        if not items: return {}
+        before = before if before is not None else float("inf")
+        marks = ",".join("?" * len(items))
+        # SQLite 中与 MAX(ts) 同行的裸列取自最大 ts 那一行
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT item, {col}, MAX(ts) FROM prices WHERE item IN ({marks}) AND market = ? "
+                f"AND ts < ? AND {col} IS NOT NULL GROUP BY item", (*items, market, before)).fetchall()
+        return {item: value for item, value, _ in rows}
+
+    def value_at(self, item, market=COMBINED, at=None, field="lowest"):
+        """at 时刻 (含) 之前最后一个值"""
+        col = _column(field)
+        at = at if at is not None else time.time()
+        row = self._one(
+            f"SELECT ts, {col} FROM prices WHERE item = ? AND market = ? AND ts <= ? AND {col} IS NOT NULL "
+            "ORDER BY ts DESC LIMIT 1", (item, market, at))
+        return tuple(row) if row else None
+
+    def change(self, item, market=COMBINED, hours=1, field="lowest", now=None):
+        """最新值相对 N 小时前的涨跌幅 (0.05 = +5%)；数据不足返回 None"""
+        now = now if now is not None else time.time()
+        latest = self.value_at(item, market, now, field)
+        past = self.value_at(item, market, now - hours * 3600, field)
+        if not latest or not past or not past[1]: return None
+        return (latest[1] - past[1]) / past[1]
+
+    def min_over(self, item, market=COMBINED, hours=24, field="lowest", now=None):
+        """最近 N 小时窗口内的最低值"""
+        col = _column(field)
+        now = now if now is not None else time.time()
+        row = self._one(
+            f"SELECT MIN({col}) FROM prices WHERE item = ? AND market = ? AND ts > ? AND ts <= ?",
+            (item, market, now - hours * 3600, now))
+        return row[0] if row else None
+
+    def series(self, item, market=COMBINED, hours=24, field="lowest", now=None):
+        """窗口内的 [(ts, value), ...]，按时间升序"""
+        col = _column(field)
+        now = now if now is not None else time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT ts, {col} FROM prices WHERE item = ? AND market = ? AND ts > ? AND ts <= ? "
+                f"AND {col} IS NOT NULL ORDER BY ts", (item, market, now - hours * 3600, now)).fetchall()
+        return [tuple(r) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _column(field):
+    if field not in _FIELDS:
+        raise ValueError(f"未知字段: {field}")
+    return field
+
+
+# 进程内单例
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PriceStore()
+        return _store
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+def combine_lowest(market_prices, key=None):
+    """
+    各市场最低价按饰品对齐后取列最小值。
+    market_prices: {市场: Series(饰品名 -> 价格)}，价格可以是 "-"、0 或缺失
+    key: 可选，把饰品名映射为规范键 (同一件的不同写法会先合并)
+    返回 Series(键 -> 综合最低价)，两个市场都没有价格的为 NaN
+    """
+    columns = {}
+    for market, s in market_prices.items():
+        s = pd.to_numeric(s, errors="coerce")
+        s = s.where(s > 0)                      # 0 = 无在售，不参与比价
+        if key is not None and len(s):
+            s = s.groupby(key).min()            # 多个写法取最低 (NaN 自动跳过)
+        columns[market] = s
+    if not columns:
+        return pd.Series(dtype=float)
+    return pd.DataFrame(columns).min(axis=1, skipna=True)
+
+
+def trend_column(current, last):
+    """
+    价格 + 环比的 HTML 文本，按整列计算
+    current/last: 对齐的 Series，缺失为 NaN (current 缺失显示 "无货"，last 缺失显示 "(新)")
+    """
+    cur = current.fillna(0)
+    diff = cur - last
+    pct = diff / last * 100
+
+    cur_txt = cur.astype(str)
+    pct_txt = pct.map("{:+.1f}".format)
+
+    return pd.Series(np.select(
+        [last.isna(), last == 0, cur == 0, diff > 0, diff < 0],
+        [cur_txt + " (新)",
+         cur_txt,
+         "无货",
+         cur_txt + " <span style='color:red; font-size:0.9em;'>(" + pct_txt + "%)</span>",
+         cur_txt + " <span style='color:green; font-size:0.9em;'>(" + pct_txt + "%)</span>"],
+        default=cur_txt,
+    ), index=current.index)
+
+
+def build_report(evaluated, last, display=str):
+    """
+    生成邮件表格 (配方 / 类型 / 饰品名称 / 最低价(环比) / 状态)
+    evaluated: RecipeBook.evaluate() 的结果 (产出表, 材料表, 成本表)
+    last: 环比基准价 Series(规范键 -> 价格)
+    """
+    out, inp, costs = evaluated
+
+    # --- A类 (产出) ---
+    rate = out["profit_rate"]
+    rate_txt = rate.map("{:.1%}".format)
+    a_report = pd.DataFrame({
+        "配方": costs["配方"].to_numpy()[out["recipe"].to_numpy(dtype=int)],
+        "类型": "产出 (A)",
+        "饰品名称": out["name"].map(display).str.replace(" (久经沙场)", "", regex=False),  # 简化名称显示
+        "最低价(环比)": trend_column(out["price"], last.reindex(out["key"]).set_axis(out.index)),
+        "状态": np.select(
+            [rate.isna(), out["profitable"]],
+            ["普通", "<b style='color:red'>🔥正期望 (" + rate_txt + ")</b>"],
+            default="利润率 " + rate_txt,
+        ),
+        "_recipe": out["recipe"], "_order": 0,
+    })
+
+    # --- B类 (材料) ---
+    b_report = pd.DataFrame({
+        "配方": costs["配方"].to_numpy()[inp["recipe"].to_numpy(dtype=int)],
+        "类型": "材料 (B)",
+        "饰品名称": inp["name"].map(display),
+        "最低价(环比)": trend_column(inp["price"], last.reindex(inp["key"]).set_axis(inp.index)),
+        "状态": np.where(inp["is_best"], "<b style='color:blue'>最佳材料</b>", "-"),
+        "_recipe": inp["recipe"], "_order": 1,
+    })
+
+    # 按配方分组：每个配方先列产出再列材料
+    report = pd.concat([a_report, b_report], ignore_index=True)
+    report = report.sort_values(["_recipe", "_order"], kind="stable")
+    return report.drop(columns=["_recipe", "_order"]).reset_index(drop=True)
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import metrics
+
+# ================= 配置区 =================
+# 市场 -> (初始速率 次/秒, 突发容量, 速率上限)
+LIMITS = {
+    "BUFF": (3.0, 3, 5.0),
+    "YouPin": (2.0, 3, 4.0),
+}
+MIN_RATE = 0.2           # 被限流后最低降到 5 秒一次
+BACKOFF_FACTOR = 0.5     # 遇到 429 / 验证码：速率减半
+RECOVER_STEP = 0.05      # 每次成功请求速率回升多少 (加性增、乘性减)
+PENALTY_PAUSE = 30       # 遇到 429 / 验证码后整个市场暂停多久 (秒)
+CAPTCHA_MARKERS = ("captcha", "verify", "验证码", "安全验证")
+# =========================================
+
+
+class TokenBucket:
+    """
+    令牌桶：平均 rate 次/秒，最多攒 burst 个令牌。
+    线程安全，同一个桶可以同时给爬虫线程 (同步) 和浏览器服务线程 (协程) 用。
+    速率会自适应：被限流时减半并暂停一段时间，之后每次成功缓慢回升。
+    """
+
+    def __init__(self, name, rate, burst, max_rate):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """预定一个令牌，返回需要等待的秒数 (令牌可以透支，排在后面的人等得更久)"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self):
+        """同步取令牌 (直连接口)"""
+        wait = self._reserve()
+        if wait > 0:
+            metrics.observe("rate_wait", wait, market=self.name)
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """协程取令牌 (浏览器导航)，等待时不阻塞其它标签页"""
+        wait = self._reserve()
+        if wait > 0:
+            metrics.observe("rate_wait", wait, market=self.name)
+            await asyncio.sleep(wait)
+
+    def reward(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RECOVER_STEP)
+
+    def penalize(self, reason):
+        with self._lock:
+            self.rate = max(MIN_RATE, self.rate * BACKOFF_FACTOR)
+            self.tokens = min(self.tokens, 0.0)
+            self._paused_until = time.monotonic() + PENALTY_PAUSE
+            rate = self.rate
+        metrics.inc("throttled", market=self.name)
+        print(f"🐢 [{self.name}] 被限流 ({reason})，暂停 {PENALTY_PAUSE}s，速率降至 {rate:.2f} 次/秒")
+
+
+def looks_like_captcha(*texts):
+    """URL / 页面标题 / 返回内容里出现验证码特征"""
+    return any(m in (t or "") for t in texts for m in CAPTCHA_MARKERS)
+
+
+# ---------------- 进程内单例 ----------------
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(market):
+    with _limiters_lock:
+        if market not in _limiters:
+            rate, burst, max_rate = LIMITS[market]
+            _limiters[market] = TokenBucket(market, rate, burst, max_rate)
+        return _limiters[market]
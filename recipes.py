@@ -0,0 +1,262 @@
+import json
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+from xml.etree import ElementTree
+
+import catalog
+import orderbook
+
+# ================= 配置区 =================
+TASK_FILE = "task.xlsx"        # 每个工作表一个配方 (布局见 load_from_excel)
+RECIPE_FILE = "recipes.json"   # 可选：更完整的配方清单，存在时优先使用
+INPUT_COUNT = 5                # 默认材料数量
+PROFIT_THRESHOLD = 0.15        # 默认正期望阈值
+# =========================================
+
+
+@dataclass
+class Recipe:
+    """一个炼金配方：用 input_count 个最便宜的材料换一个产出"""
+    name: str
+    outputs: list                       # 产出 (A 类)
+    inputs: list                        # 材料 (B 类)
+    input_count: int = INPUT_COUNT
+    wear: str = catalog.DEFAULT_WEAR    # 产出的磨损档位，没写磨损时自动补上
+    threshold: float = PROFIT_THRESHOLD
+
+    def output_names(self):
+        """产出名补齐磨损后缀 (已写了就保持原样)"""
+        return [n if f"({self.wear})" in n else f"{n} ({self.wear})" for n in self.outputs]
+
+
+# ---------------- task.xlsx 轻量读取 (标准库，不加载 pandas / openpyxl) ----------------
+_NS = {
+    "m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+
+
+def _column_index(letters):
+    """"A" -> 0, "B" -> 1, "AA" -> 26"""
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - ord("A") + 1
+    return n - 1
+
+
+def read_xlsx(path):
+    """
+    返回 {工作表名: {(行, 列): 文本}} (行列从 0 开始，空单元格不出现)。
+    xlsx 本身是 zip + XML，只读单元格值足够解析配方，比 pandas.read_excel 启动快得多。
+    """
+    with zipfile.ZipFile(path) as z:
+        shared = []
+        if "xl/sharedStrings.xml" in z.namelist():
+            root = ElementTree.fromstring(z.read("xl/sharedStrings.xml"))
+            for si in root.findall("m:si", _NS):
+                shared.append("".join(t.text or "" for t in si.iter(f"{{{_NS['m']}}}t")))
+
+        rels = ElementTree.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        targets = {r.get("Id"): r.get("Target") for r in rels.findall("rel:Relationship", _NS)}
+        workbook = ElementTree.fromstring(z.read("xl/workbook.xml"))
+
+        sheets = {}
+        for sheet in workbook.findall("m:sheets/m:sheet", _NS):
+            target = targets[sheet.get(_REL_ID)]
+            target = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            cells = {}
+            for c in ElementTree.fromstring(z.read(target)).iter(f"{{{_NS['m']}}}c"):
+                m = _CELL_REF.match(c.get("r", ""))
+                if not m: continue
+                kind = c.get("t")
+                if kind == "inlineStr":
+                    value = "".join(t.text or "" for t in c.iter(f"{{{_NS['m']}}}t"))
+                else:
+                    v = c.find("m:v", _NS)
+                    if v is None or v.text is None: continue
+                    value = shared[int(v.text)] if kind == "s" else v.text
+                cells[(int(m.group(2)) - 1, _column_index(m.group(1)))] = value
+            sheets[sheet.get("name")] = cells
+        return sheets
+
+
+def load_from_excel(path=TASK_FILE):
+    """
+    task.xlsx 的每个工作表是一个配方：
+        A1          配方名 (如 "手套武器箱/九头蛇武器箱")
+        第1行 B 列起  产出
+        第3行起 B 列  材料
+    """
+    recipes = []
+    for sheet_name, cells in read_xlsx(path).items():
+        text = {pos: v.strip() for pos, v in cells.items() if v.strip()}
+        name = text.get((0, 0)) or str(sheet_name)
+
+        outputs = [v for (r, c), v in sorted(text.items()) if r == 0 and c >= 1]
+        inputs = [v for (r, c), v in sorted(text.items()) if r >= 2 and c == 1]
+        if outputs and inputs:
+            recipes.append(Recipe(name, outputs, inputs))
+    return recipes
+
+
+def load_from_manifest(path=RECIPE_FILE):
+    """recipes.json: [{"name", "outputs", "inputs", "input_count", "wear", "threshold"}, ...]"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [Recipe(**entry) for entry in data]
+
+
+def load_recipes():
+    """优先读 recipes.json，没有则读 task.xlsx；失败返回空列表"""
+    try:
+        if os.path.exists(RECIPE_FILE):
+            recipes = load_from_manifest()
+        else:
+            recipes = load_from_excel()
+        print(f"📋 已加载 {len(recipes)} 个配方")
+        return recipes
+    except Exception as e:
+        print(f"❌ 读取配方失败: {e}")
+        return []
+
+
+class RecipeBook:
+    """
+    把所有配方展开成长表 (配方序号, 饰品键)，每轮价格快照只做一次批量计算：
+      cost_table()  每个配方的最便宜材料价与总成本
+      evaluate()    所有配方所有产出的利润率与状态
+    流式管道里单件饰品更新时，用 recipes_using() + evaluate_recipe() 只重算相关配方。
+    """
+
+    def __init__(self, recipes, key=catalog.normalize_name):
+        import pandas as pd  # 第一次计算时才加载 (启动不等 pandas)
+
+        self.recipes = recipes
+        self.key = key
+
+        rows_out, rows_in = [], []
+        for i, r in enumerate(recipes):
+            rows_out += [(i, key(n), n) for n in r.output_names()]
+            rows_in += [(i, key(n), n) for n in r.inputs]
+        self.outputs = pd.DataFrame(rows_out, columns=["recipe", "key", "name"])
+        self.inputs = pd.DataFrame(rows_in, columns=["recipe", "key", "name"])
+        self.meta = pd.DataFrame({
+            "配方": [r.name for r in recipes],
+            "input_count": [r.input_count for r in recipes],
+            "threshold": [r.threshold for r in recipes],
+        })
+
+        # 规范键 -> 用到它 (产出或材料) 的配方序号
+        self.by_key = {}
+        for i, k, _ in rows_out + rows_in:
+            self.by_key.setdefault(k, set()).add(i)
+
+    def targets(self):
+        """
+        所有配方用到的饰品 (按规范键去重，产出在前)，抓一遍即可服务全部配方
+        返回 [{"name": 补齐磨损的名称, "raw": 表格原文, "output": 是否产出, "wear": 磨损}, ...]
+        """
+        seen, result = set(), []
+        for r in self.recipes:
+            for raw, full in zip(r.outputs, r.output_names()):
+                k = self.key(full)
+                if k not in seen:
+                    seen.add(k)
+                    result.append({"name": full, "raw": raw, "output": True, "wear": r.wear})
+        for r in self.recipes:
+            for n in r.inputs:
+                k = self.key(n)
+                if k not in seen:
+                    seen.add(k)
+                    result.append({"name": n, "raw": n, "output": False, "wear": None})
+        return result
+
+    def max_input_count(self):
+        """所有配方里最大的材料数量：抓取时每件至少要看到这么多挂单"""
+        return max((r.input_count for r in self.recipes), default=INPUT_COUNT)
+
+    def _input_costs(self, combined, ladders=None):
+        """
+        材料长表加上单价 price 与买够 input_count 件的成本 fill。
+        有挂单深度时用 orderbook.fill_cost 跨市场吃单；深度缺失或不够时退回 单价 × 数量。
+        """
+        import pandas as pd
+
+        inp = self.inputs.copy()
+        idx = inp["recipe"].to_numpy(dtype=int)
+        inp["price"] = combined.reindex(inp["key"]).to_numpy()
+        count = self.meta["input_count"].to_numpy()[idx]
+
+        naive = inp["price"] * count
+        if ladders:
+            fill = [orderbook.fill_cost(ladders.get(k, []), n)[0] for k, n in zip(inp["key"], count)]
+            inp["fill"] = pd.Series(fill, index=inp.index, dtype=float).fillna(naive)
+        else:
+            inp["fill"] = naive
+        return inp
+
+    def _cost_table(self, inp):
+        table = self.meta.copy()
+        grouped = inp.groupby("recipe")
+        table["min_input"] = grouped["price"].min().reindex(table.index).to_numpy()
+        table["cost"] = grouped["fill"].min().reindex(table.index).to_numpy()
+        return table
+
+    def cost_table(self, combined, ladders=None):
+        """
+        每个配方：最便宜材料单价 min_input，与买够数量的最低总成本 cost
+        ladders: {规范键: [各市场按价格升序的挂单列表]}，可选
+        """
+        return self._cost_table(self._input_costs(combined, ladders))
+
+    def recipes_using(self, key):
+        return self.by_key.get(key, set())
+
+    def evaluate_recipe(self, i, prices, ladders=None):
+        """
+        单个配方的标量版 evaluate (成本取法与 _input_costs / _cost_table 一致)
+        prices: {规范键: 综合最低价}，缺失或 NaN 表示无价；ladders 同 cost_table
+        返回 [(产出键, 产出名, 售价, 成本, 利润率, 是否正期望), ...]
+        """
+        r = self.recipes[i]
+        costs = []
+        for n in r.inputs:
+            k = self.key(n)
+            fill = orderbook.fill_cost(ladders.get(k, []), r.input_count)[0] if ladders else None
+            price = prices.get(k)
+            if fill is None and price is not None and price == price:  # NaN != NaN
+                fill = price * r.input_count
+            if fill is not None: costs.append(fill)
+        cost = min(costs) if costs else float("nan")
+
+        result = []
+        for n in r.output_names():
+            k = self.key(n)
+            price = prices.get(k, float("nan"))
+            rate = (price - cost) / price if price == price and price else float("nan")
+            result.append((k, n, price, cost, rate, bool(rate > r.threshold)))
+        return result
+
+    def evaluate(self, combined, ladders=None):
+        """
+        返回 (产出表, 材料表, 成本表)
+        产出表列: recipe, key, name, price, cost, profit_rate, profitable
+        材料表列: recipe, key, name, price, fill, is_best
+        """
+        inp = self._input_costs(combined, ladders)
+        costs = self._cost_table(inp)
+
+        out = self.outputs.copy()
+        idx = out["recipe"].to_numpy(dtype=int)
+        out["price"] = combined.reindex(out["key"]).to_numpy()
+        out["cost"] = costs["cost"].to_numpy()[idx]
+        out["profit_rate"] = (out["price"] - out["cost"]) / out["price"]
+        out["profitable"] = out["profit_rate"] > costs["threshold"].to_numpy()[idx]
+
+        idx = inp["recipe"].to_numpy(dtype=int)
+        inp["is_best"] = inp["fill"].notna() & (inp["fill"] == costs["cost"].to_numpy()[idx])
+        return out, inp, costs
@@ -0,0 +1,170 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# ================= 配置区 =================
+TIMEOUT_WINDOW = 50        # 每个阶段保留最近多少次成功耗时
+TIMEOUT_MIN_SAMPLES = 5    # 样本不足时用初始超时
+TIMEOUT_MULTIPLIER = 3.0   # 超时 = P95 x 倍数 (再夹在上下限之间)
+RETRY_BUDGET = 6           # 每个市场每轮最多重试次数 (所有饰品共用)
+MAX_RETRIES = 2            # 单个请求最多重试几次
+BACKOFF_BASE = 0.5         # 退避基数 (秒)，第 n 次重试等 base * 2^n (带抖动)
+BACKOFF_MAX = 8.0
+BREAKER_THRESHOLD = 4      # 连续失败多少件后熔断该市场
+BREAKER_COOLDOWN = 600     # 熔断后多久允许试探一次 (秒)
+# =========================================
+
+
+class AdaptiveTimeout:
+    """
+    由最近成功耗时的 P95 推出的超时：网站快时少等，变慢时自动放宽。
+    seconds 在 [floor, ceiling] 之间；样本不足时返回 initial。
+    """
+
+    def __init__(self, initial, floor, ceiling):
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self._samples = deque(maxlen=TIMEOUT_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    @property
+    def seconds(self):
+        with self._lock:
+            if len(self._samples) < TIMEOUT_MIN_SAMPLES:
+                return self.initial
+            ordered = sorted(self._samples)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return min(self.ceiling, max(self.floor, p95 * TIMEOUT_MULTIPLIER))
+
+    @property
+    def ms(self):
+        """Playwright 的 timeout 参数单位是毫秒"""
+        return int(self.seconds * 1000)
+
+
+class RetryBudget:
+    """每轮有限的重试次数 + 指数退避，避免网站出问题时每件都重试到底"""
+
+    def __init__(self, budget=RETRY_BUDGET):
+        self.budget = budget
+        self.remaining = budget
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.remaining = self.budget
+
+    def take(self):
+        """消耗一次重试机会；用完返回 False"""
+        with self._lock:
+            if self.remaining <= 0: return False
+            self.remaining -= 1
+            return True
+
+    @staticmethod
+    def backoff(attempt):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class CircuitBreaker:
+    """
+    连续失败 threshold 件后熔断 (open)：本轮剩下的饰品直接跳过并标为过期，不再逐件等超时。
+    cooldown 之后放行一件试探 (half-open)，成功即恢复。
+    """
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None: return True
+            if time.time() - self.opened_at >= self.cooldown:
+                self.opened_at = time.time()  # 半开：放行一件，失败则重新计时
+                print(f"🔌 [{self.name}] 熔断冷却结束，试探一次")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"✅ [{self.name}] 试探成功，恢复抓取")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= self.threshold:
+                self.opened_at = time.time()
+                metrics.inc("breaker_open", market=self.name)
+                print(f"⛔ [{self.name}] 连续失败 {self.failures} 件，熔断 {self.cooldown // 60} 分钟")
+
+
+class MarketGuard:
+    """一个市场的超时 / 重试 / 熔断状态 (跨轮次保留，重试预算每轮重置)"""
+
+    # 阶段 -> (初始, 下限, 上限) 秒
+    TIMEOUTS = {
+        "sell_order": (6, 2, 12),    # BUFF 详情页 expect_response
+        "search": (8, 3, 15),        # 搜索跳转 (BUFF wait_for_url / 悠悠搜索框)
+        "table": (5, 2, 10),         # 悠悠表格出现
+    }
+
+    def __init__(self, market):
+        self.market = market
+        self.timeouts = {stage: AdaptiveTimeout(*v) for stage, v in self.TIMEOUTS.items()}
+        self.retries = RetryBudget()
+        self.breaker = CircuitBreaker(market)
+
+    def timeout(self, stage):
+        return self.timeouts[stage]
+
+    def new_cycle(self):
+        self.retries.reset()
+
+    def retry(self, attempt):
+        """第 attempt 次重试是否允许；允许的话先退避等待 (同步)"""
+        if attempt >= MAX_RETRIES or not self.retries.take():
+            return False
+        metrics.inc("retry", market=self.market)
+        time.sleep(RetryBudget.backoff(attempt))
+        return True
+
+    async def retry_async(self, attempt):
+        """同 retry，用于浏览器服务线程里的协程"""
+        if attempt >= MAX_RETRIES or not self.retries.take():
+            return False
+        metrics.inc("retry", market=self.market)
+        await asyncio.sleep(RetryBudget.backoff(attempt))
+        return True
+
+
+# ---------------- 进程内单例 ----------------
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(market):
+    with _guards_lock:
+        if market not in _guards:
+            _guards[market] = MarketGuard(market)
+        return _guards[market]
@@ -0,0 +1,145 @@
+import heapq
+import math
+import time
+from collections import deque
+
+import price_store
+
+# ================= 配置区 =================
+MIN_INTERVAL = 5 * 60         # 最快 5 分钟抓一次 (临近阈值 / 波动大)
+MAX_INTERVAL = 6 * 3600       # 最慢 6 小时抓一次 (稳定且离阈值很远)
+DEFAULT_INTERVAL = 3600       # 信息不足时的间隔
+HOURLY_BUDGET = 240           # 全局预算：每小时最多抓多少件 (两个市场各一次算一件)
+NEAR_BAND = 0.10              # 利润率与阈值相差在此范围内视为"临近"
+VOL_WINDOW_HOURS = 24         # 波动率回看窗口
+VOL_HIGH = 0.03               # 单次涨跌的标准差达到 3% 视为高波动
+BATCH_WINDOW = 60             # 接下来 60 秒内到期的一并抓，减少启动开销
+# =========================================
+
+
+class PollScheduler:
+    """
+    每件饰品一个"下次抓取时间"，放在小顶堆里。
+    抓完后根据两项紧迫度重新排期：
+      - 所在配方利润率离阈值有多近 (越近越急)
+      - 近期价格波动率 (越大越急)
+    紧迫度在 [0, 1]，映射到 MIN_INTERVAL ~ MAX_INTERVAL；
+    所有饰品的抓取频率之和超过 HOURLY_BUDGET 时，整体按比例放慢。
+    """
+
+    def __init__(self, keys, store=None, budget=HOURLY_BUDGET):
+        self.store = store or price_store.get_store()
+        self.budget = budget
+        self.intervals = {k: DEFAULT_INTERVAL for k in keys}
+        self._heap = []
+        self._seq = 0
+        self._polls = deque()  # 最近一小时的抓取时间，用于预算控制
+
+        now = time.time()
+        for k in keys:
+            self._push(now, k)  # 启动时全部立即到期
+
+    def _push(self, due, key):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key))
+
+    # ---------------- 取任务 ----------------
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def _trim(self, now):
+        while self._polls and self._polls[0] <= now - 3600:
+            self._polls.popleft()
+
+    def budget_wait(self, now=None):
+        """预算用完时，距最早一次抓取滑出一小时窗口还有多少秒；预算未用完返回 0"""
+        now = now or time.time()
+        self._trim(now)
+        if len(self._polls) < self.budget: return 0
+        return self._polls[0] + 3600 - now
+
+    def due_items(self, now=None):
+        """弹出已到期 (含 BATCH_WINDOW 内将到期) 的饰品，受每小时预算限制"""
+        now = now or time.time()
+        self._trim(now)
+        remaining = max(0, self.budget - len(self._polls))
+
+        due = []
+        seen = set()
+        while self._heap and self._heap[0][0] <= now + BATCH_WINDOW and len(due) < remaining:
+            _, _, key = heapq.heappop(self._heap)
+            if key in seen: continue  # 同一件被重复排期时只取一次
+            seen.add(key)
+            due.append(key)
+
+        if not due and self._heap and self._heap[0][0] <= now and remaining == 0:
+            # 预算用完：等最早的一次抓取滑出一小时窗口再继续
+            print(f"⏳ 已达每小时预算 {self.budget} 件，暂缓抓取")
+        self._polls.extend([now] * len(due))
+        return due
+
+    # ---------------- 重新排期 ----------------
+    def volatility(self, key, now=None):
+        """窗口内综合最低价逐次涨跌幅的标准差；数据不足返回 None"""
+        points = self.store.series(key, price_store.COMBINED, hours=VOL_WINDOW_HOURS, now=now)
+        values = [v for _, v in points if v]
+        if len(values) < 3: return None
+        returns = [(b - a) / a for a, b in zip(values, values[1:])]
+        mean = sum(returns) / len(returns)
+        return math.sqrt(sum((r - mean) ** 2 for r in returns) / len(returns))
+
+    def interval_for(self, key, gap):
+        """
+        gap: 利润率与阈值的距离 (NaN/None 表示未知)。
+        未知 (没抓到价格 / 所在配方没有产出价) 时最慢只按 DEFAULT_INTERVAL 抓，不能因为缺数据反而最少抓
+        """
+        known = gap is not None and not math.isnan(gap)
+        urgency = 0.0
+        if known:
+            urgency = max(urgency, 1 - min(1.0, abs(gap) / NEAR_BAND))
+        vol = self.volatility(key)
+        if vol is not None:
+            urgency = max(urgency, min(1.0, vol / VOL_HIGH))
+        if not known and vol is None:
+            return DEFAULT_INTERVAL
+        interval = MAX_INTERVAL - urgency * (MAX_INTERVAL - MIN_INTERVAL)
+        return interval if known else min(interval, DEFAULT_INTERVAL)
+
+    def reschedule(self, keys, gaps, now=None):
+        """keys: 本轮刚抓完的饰品；gaps: {键: 利润率与阈值的距离}"""
+        now = now or time.time()
+        for k in keys:
+            self.intervals[k] = self.interval_for(k, gaps.get(k))
+
+        # 需求超预算时整体放慢
+        demand = sum(3600 / iv for iv in self.intervals.values())
+        scale = max(1.0, demand / self.budget)
+        for k in keys:
+            self._push(now + self.intervals[k] * scale, k)
+        if scale > 1:
+            print(f"⚖️ 抓取需求 {demand:.0f} 件/小时 超出预算，间隔放大 {scale:.2f} 倍")
+
+    def add(self, key, now=None):
+        """新增的饰品 (配方变更) 立即到期"""
+        if key not in self.intervals:
+            self.intervals[key] = DEFAULT_INTERVAL
+            self._push(now or time.time(), key)
+
+
+def threshold_gaps(out, costs, inp):
+    """
+    由配方评估结果计算每件饰品的 "利润率 - 阈值" 距离：
+      产出取自身，材料取所在配方各产出中最近的那个
+    """
+    gap = (out["profit_rate"] - costs["threshold"].to_numpy()[out["recipe"].to_numpy(dtype=int)]).abs()
+    gaps = gap.groupby(out["key"]).min().to_dict()
+
+    recipe_gap = gap.groupby(out["recipe"]).min()
+    inp_gap = inp["recipe"].map(recipe_gap)
+    for k, g in inp_gap.groupby(inp["key"]).min().items():
+        cur = gaps.get(k)
+        if cur is None or math.isnan(cur):
+            gaps[k] = g
+        elif not math.isnan(g):
+            gaps[k] = min(cur, g)
+    return gaps
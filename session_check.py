@@ -0,0 +1,198 @@
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+# ================= 配置区 =================
+ENABLED = True
+EXPIRY_MARGIN = 600           # cookie 剩余有效期不足 10 分钟即视为过期
+ALERT_INTERVAL = 6 * 3600     # 同一市场的重新登录提醒，邮件最短间隔 (秒)
+PREFLIGHT_TIMEOUT = 3         # 预检请求超时 (秒)
+
+# 各市场的登录文件 (Playwright storage_state) 与校验规则
+MARKETS = {
+    "BUFF": {
+        "auth_file": "buff_auth.json",
+        "domain": "163.com",
+        "cookies": ["session"],          # 必须存在且未过期的 cookie
+        "tokens": [],
+        "login_script": "get_cookie_buff.py",
+    },
+    "YouPin": {
+        "auth_file": "uu_auth.json",
+        "domain": "youpin898.com",
+        "cookies": [],
+        # 登录令牌：cookie 或 localStorage 里按名字找 (不区分大小写)，是 JWT 时再看令牌自带的 exp。
+        # 名字未经真实登录文件确认：一个都找不到时只打印警告，退回 "有未过期 cookie / localStorage" 的检查
+        "tokens": ["uu_token", "token", "access_token", "authorization"],
+        "login_script": "get_cookie_uu.py",
+    },
+}
+# =========================================
+
+
+def jwt_expiry(value):
+    """JWT 令牌载荷里的 exp (秒)；不是 JWT 或没有 exp 返回 None"""
+    parts = str(value).split(" ")[-1].split(".")  # 兼容 "Bearer xxx"
+    if len(parts) != 3: return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (ValueError, AttributeError):
+        return None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+def token_status(state, domain, tokens, now):
+    """按名字找登录令牌 (cookie / localStorage)，返回 (是否有效, 原因)；一个都没找到返回 None"""
+    wanted = {t.lower() for t in tokens}
+    found = []  # (名字, 过期时间或 None)
+    for c in state.get("cookies", []):
+        if domain in c.get("domain", "") and c.get("name", "").lower() in wanted:
+            expires = c.get("expires", -1)
+            jwt_exp = jwt_expiry(c.get("value", ""))
+            found.append((c["name"], jwt_exp or (expires if expires > 0 else None)))
+    for o in state.get("origins", []):
+        if domain not in o.get("origin", ""): continue
+        for entry in o.get("localStorage", []):
+            if entry.get("name", "").lower() in wanted and entry.get("value"):
+                found.append((entry["name"], jwt_expiry(entry["value"])))
+
+    if not found: return None
+    alive = [name for name, exp in found if exp is None or exp > now + EXPIRY_MARGIN]
+    if alive:
+        return True, f"登录令牌 {alive[0]} 有效"
+    last = max(exp for _, exp in found)
+    return False, f"登录令牌已于 {datetime.fromtimestamp(last).strftime('%m-%d %H:%M')} 过期"
+
+
+def cookie_status(auth_file, domain, names=(), now=None, tokens=()):
+    """
+    只读本地 storage_state 文件判断登录态 (毫秒级，不发请求)
+    tokens: 给了就优先认这些名字的登录令牌 (见 token_status)，都不存在时按普通 cookie 检查
+    返回 (是否有效, 原因)
+    """
+    now = now or time.time()
+    if not os.path.exists(auth_file):
+        return False, f"未找到登录文件 {auth_file}"
+    try:
+        with open(auth_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as e:
+        return False, f"登录文件无法读取: {e}"
+    if tokens:
+        status = token_status(state, domain, tokens, now)
+        if status is not None:
+            return status
+        print(f"⚠️ [预检] {auth_file} 里没有已知的登录令牌 ({'/'.join(tokens)})，改为只检查 cookie；"
+              f"请把实际的令牌名补进 session_check.MARKETS")
+
+    cookies = [c for c in state.get("cookies", []) if domain in c.get("domain", "")]
+    if names:
+        cookies = [c for c in cookies if c.get("name") in names]
+        if not cookies:
+            return False, f"登录文件里没有 {'/'.join(names)} cookie"
+
+    if cookies:
+        # expires 为 -1 的是会话 cookie，没有固定过期时间
+        alive = [c for c in cookies if c.get("expires", -1) <= 0 or c["expires"] > now + EXPIRY_MARGIN]
+        if not alive:
+            last = max(c["expires"] for c in cookies)
+            return False, f"登录已于 {datetime.fromtimestamp(last).strftime('%m-%d %H:%M')} 过期"
+        return True, "cookie 有效"
+
+    origins = [o for o in state.get("origins", []) if domain in o.get("origin", "") and o.get("localStorage")]
+    if origins:
+        return True, "localStorage 登录信息存在"
+    return False, "登录文件里没有该站点的登录信息"
+
+
+def _check_buff_api():
+    """BUFF 额外发一次轻量的已登录请求；返回 (是否有效, 原因)，网络问题不拦截"""
+    import buff_api  # requests 较重，抓取前才加载
+    try:
+        if buff_api.get_client().check_login(timeout=PREFLIGHT_TIMEOUT):
+            return True, "接口确认已登录"
+        return False, "接口提示未登录 (cookie 已在服务端失效)"
+    except buff_api.BuffApiError as e:
+        print(f"⚠️ [预检] BUFF 登录校验请求失败，继续抓取: {e}")
+        return True, "校验请求失败，未拦截"
+
+
+# ---------------- 登录文件变化 ----------------
+_auth_mtimes = {}
+
+
+def _refresh_clients(market, auth_file):
+    """重新登录后 (登录文件被更新) 丢弃旧 cookie 的 BUFF 接口客户端；浏览器 context 由 browser_service 自行重建"""
+    mtime = os.path.getmtime(auth_file) if os.path.exists(auth_file) else None
+    if market == "BUFF" and market in _auth_mtimes and _auth_mtimes[market] != mtime:
+        import buff_api
+        buff_api.reset_client()
+    _auth_mtimes[market] = mtime
+
+
+def preflight(market):
+    """
+    抓取前的登录预检：先看本地 cookie / 登录令牌是否过期，BUFF 再发一次轻量请求。
+    失败返回 False (调用方跳过该市场)，并记下重新登录提醒。
+    """
+    if not ENABLED: return True
+    cfg = MARKETS[market]
+    t0 = time.perf_counter()
+
+    _refresh_clients(market, cfg["auth_file"])
+    ok, reason = cookie_status(cfg["auth_file"], cfg["domain"], cfg["cookies"], tokens=cfg["tokens"])
+    if ok and market == "BUFF":
+        ok, reason = _check_buff_api()
+
+    metrics.observe("preflight", time.perf_counter() - t0, market=market)
+    if ok:
+        print(f"🔑 [预检] {market} 登录有效 ({reason})")
+        return True
+
+    metrics.inc("session_invalid", market=market)
+    raise_alert(market, reason)
+    return False
+
+
+# ---------------- 重新登录提醒 ----------------
+_alerts = {}         # 市场 -> 待发送的提醒文本
+_alert_sent = {}     # 市场 -> 上次发邮件的时间
+_alerts_lock = threading.Lock()
+
+
+def raise_alert(market, reason):
+    script = MARKETS[market]["login_script"]
+    message = f"{market} 登录失效：{reason}。请运行 {script} 重新登录。"
+    print("\n" + "!" * 50)
+    print(f"🔐 {message}")
+    print(f"   本轮跳过 {market}，直到登录文件更新")
+    print("!" * 50 + "\n")
+    queue_alert(market, message)
+
+
+def queue_alert(market, message):
+    """记下待发送的提醒 (同一市场 ALERT_INTERVAL 内只发一次)；分片模式下主进程用它并入子进程的提醒"""
+    with _alerts_lock:
+        if time.time() - _alert_sent.get(market, 0) >= ALERT_INTERVAL:
+            _alerts[market] = message
+
+
+def take_alerts():
+    """取出待发送的提醒 {市场: 文本}，并记为已发送"""
+    with _alerts_lock:
+        alerts = dict(_alerts)
+        for market in alerts:
+            _alert_sent[market] = time.time()
+        _alerts.clear()
+    return alerts
+
+
+def drain_alerts():
+    """取出待发送的提醒文本"""
+    return list(take_alerts().values())
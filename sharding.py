@@ -0,0 +1,266 @@
+"""
+分片模式：把目标饰品按规范键哈希分到 N 个常驻子进程，每个子进程一个浏览器、一个账号的登录文件。
+
+- 分片是粘性的 (crc32(键) % N)：同一件饰品总落在同一个分片，分片自己的商品目录 / 详情页缓存一直是热的
+- 第 i 个分片使用 buff_auth_{i}.json / uu_auth_{i}.json (不存在则退回默认登录文件，即多个浏览器共用一个账号，
+  此时共用账号的分片平分该市场的请求速率)
+- 子进程结果通过队列送回主进程，合并成一个 MarketSnapshot，主流程无感知
+"""
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import zlib
+
+import catalog
+import metrics
+import pipeline
+import recipes
+import session_check
+from snapshot import MarketSnapshot
+
+# ================= 配置区 =================
+SHARD_COUNT = {"BUFF": 2, "YouPin": 2}   # 每个市场的子进程数
+SHARD_TIMEOUT = 1800                     # 单轮等待子进程结果的上限 (秒)，超时的分片本轮记为过期
+POLL_INTERVAL = 5                        # 等结果时多久检查一次子进程是否还活着
+FILE_PREFIX = {"BUFF": "BUFF_数据", "YouPin": "UU_数据"}
+# =========================================
+
+
+def shard_of(key, n):
+    """粘性分片：与进程、Python 哈希随机化无关"""
+    return zlib.crc32(key.encode("utf-8")) % n
+
+
+def shard_file(path, shard):
+    """第 0 片用原文件名，其余加后缀：buff_auth.json -> buff_auth_1.json"""
+    if shard == 0: return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{shard}{ext}"
+
+
+def _scraper(market):
+    if market == "BUFF":
+        import buff_scraper
+        return buff_scraper
+    import youpin_scraper
+    return youpin_scraper
+
+
+def shard_accounts(market, n):
+    """分片号 -> 登录文件"""
+    base = session_check.MARKETS[market]["auth_file"]
+    accounts = {}
+    for shard in range(n):
+        path = shard_file(base, shard)
+        accounts[shard] = path if os.path.exists(path) else base
+    return accounts
+
+
+def _target_names(market, book):
+    """父进程里算出该市场的目标名 (与子进程 run_scraper 的写法一致)"""
+    targets = _scraper(market).get_target_skins(book)
+    return [t["name"] if isinstance(t, dict) else t for t in targets]
+
+
+# ---------------- 子进程 ----------------
+def _worker(market, shard, auth_file, sharing, inbox, outbox):
+    """
+    常驻子进程：收到 (轮次, 键集合) 就跑一次 run_scraper(only=键集合)，
+    把快照、本分片学到的目录记录、登录失效提醒和本轮指标一起送回；收到 None 退出。
+    sharing: 共用这个登录文件的分片数
+    """
+    import browser_service
+    import buff_api
+    import rate_limiter
+
+    # 本分片的登录文件；同一账号的请求速率按分片数平分
+    session_check.MARKETS[market]["auth_file"] = auth_file
+    if sharing > 1:
+        rate, burst, max_rate = rate_limiter.LIMITS[market]
+        rate_limiter.LIMITS[market] = (rate / sharing, burst, max_rate / sharing)
+    module = _scraper(market)
+    if market == "BUFF":
+        module.AUTH_FILE = buff_api.AUTH_FILE = auth_file
+    else:
+        module.COOKIE_FILE = auth_file
+
+    # 本分片自己的商品目录副本：启动时从主目录复制，之后只有本分片写，不和其它进程抢文件
+    cat_file = f"{os.path.splitext(catalog.CATALOG_FILE)[0]}.{market}{shard}.json"
+    if os.path.exists(catalog.CATALOG_FILE):
+        shutil.copy(catalog.CATALOG_FILE, cat_file)
+    catalog._catalog = catalog.Catalog(cat_file)
+    cat = catalog.get_catalog()
+    print(f"🧩 [{market}#{shard}] 子进程就绪，登录文件 {auth_file}")
+
+    try:
+        while True:
+            job = inbox.get()
+            if job is None: break
+            job_id, keys = job
+            snap, learned, error = None, None, None
+            try:
+                browser_service.begin_cycle()
+                snap = module.run_scraper(only=keys)
+                with cat._lock:
+                    learned = ({k: cat.items[k] for k in keys if k in cat.items}, dict(cat.aliases))
+            except Exception as e:
+                error = repr(e)
+            # 子进程里没人发提醒、导出指标，连同结果一起送回主进程
+            extras = (session_check.take_alerts(), metrics.get_metrics().take_cycle())
+            outbox.put((job_id, shard, snap, learned, error, extras))
+    finally:
+        browser_service.shutdown()
+
+
+# ---------------- 主进程 ----------------
+class ShardPool:
+    """一个市场的 N 个常驻子进程 (spawn 方式启动，Windows / 打包后的 exe 同样可用)"""
+
+    def __init__(self, market, n):
+        self.market = market
+        self.n = n
+        self._ctx = multiprocessing.get_context("spawn")
+        self.outbox = self._ctx.Queue()
+        self.inboxes = [None] * n
+        self.procs = [None] * n
+        self._job_id = 0
+        self.accounts = shard_accounts(market, n)
+        for i in range(n):
+            self._start(i)
+
+    def _start(self, shard):
+        auth_file = self.accounts[shard]
+        sharing = sum(1 for a in self.accounts.values() if a == auth_file)
+        inbox = self._ctx.Queue()
+        proc = self._ctx.Process(target=_worker,
+                                 args=(self.market, shard, auth_file, sharing, inbox, self.outbox),
+                                 name=f"{self.market}-shard{shard}")
+        proc.start()
+        self.inboxes[shard] = inbox
+        self.procs[shard] = proc
+
+    def run(self, parts, timeout=SHARD_TIMEOUT):
+        """
+        parts: {分片号: 键集合}；返回 ({分片号: 快照}, 没拿到结果的分片号集合)
+        子进程意外退出会先被重新拉起
+        """
+        self._job_id += 1
+        job_id = self._job_id
+        for shard, keys in parts.items():
+            if not self.procs[shard].is_alive():
+                print(f"♻️ [{self.market}#{shard}] 子进程已退出，重新启动")
+                self._start(shard)
+            self.inboxes[shard].put((job_id, keys))
+
+        results, pending = {}, set(parts)
+        cat = catalog.get_catalog()
+        deadline = time.monotonic() + timeout
+        while pending:
+            try:
+                got_id, shard, snap, learned, error, (alerts, cycle) = self.outbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                dead = {s for s in pending if not self.procs[s].is_alive()}
+                if dead:
+                    print(f"💥 [{self.market}] 分片 {sorted(dead)} 子进程意外退出，本轮记为过期")
+                    pending -= dead
+                elif time.monotonic() > deadline:
+                    print(f"⏰ [{self.market}] 分片 {sorted(pending)} 超时未返回，本轮记为过期")
+                    break
+                continue
+            # 提醒和指标不论是不是本轮的都并入 (迟到的结果也是真实发生过的)
+            for market, message in alerts.items():
+                session_check.queue_alert(market, message)
+            metrics.get_metrics().merge(*cycle, shard=shard)
+            if got_id != job_id: continue  # 上一轮超时分片迟到的结果
+            pending.discard(shard)
+            if error:
+                print(f"❌ [{self.market}#{shard}] 子进程出错: {error}")
+                continue
+            results[shard] = snap
+            if snap:
+                # 子进程里没有流式管道，分片一返回就把这一片的结果推进去
+                for name in snap.items:
+                    if name not in snap.stale:
+                        pipeline.publish(self.market, name, snap.stats.get(name), snap.ladders.get(name))
+            # 分片学到的 ID / 商品页 / 别名写回主目录 (下次启动子进程时复制过去)
+            records, aliases = learned
+            with cat._lock:
+                cat.items.update(records)
+                cat.aliases.update(aliases)
+        cat.save()
+        return results, set(parts) - set(results)
+
+    def close(self):
+        for inbox in self.inboxes:
+            try:
+                inbox.put(None)
+            except Exception: pass
+        for proc in self.procs:
+            proc.join(timeout=15)
+            if proc.is_alive():
+                proc.terminate()
+
+
+def merge_snapshots(market, names, snapshots, started_at, stale=()):
+    """各分片快照合并成一个，饰品顺序与任务列表一致"""
+    stats, ladders, all_stale = {}, {}, set(stale)
+    for snap in snapshots:
+        if not snap: continue
+        stats.update(snap.stats)
+        ladders.update(snap.ladders)
+        all_stale |= snap.stale
+    items = [n for n in names if n in stats or n in all_stale]
+    for n in all_stale:
+        stats.setdefault(n, None)
+    timestamps = [s.timestamp for s in snapshots if s]
+    return MarketSnapshot(market, FILE_PREFIX[market], items, stats,
+                          min(timestamps) if timestamps else started_at, ladders, all_stale)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(market):
+    with _pools_lock:
+        if market not in _pools:
+            print(f"🧩 [{market}] 启动 {SHARD_COUNT[market]} 个分片子进程")
+            _pools[market] = ShardPool(market, SHARD_COUNT[market])
+        return _pools[market]
+
+
+def shutdown():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def main_task(market, only=None, export_excel=True):
+    """分片版的 buff_scraper.main_task / youpin_scraper.main_task"""
+    from datetime import datetime
+
+    cat = catalog.get_catalog()
+    book = recipes.RecipeBook(recipes.load_recipes())
+    names = _target_names(market, book)
+    if only is not None:
+        names = [n for n in names if cat.key(n) in only]
+    if not names: return
+
+    pool = get_pool(market)
+    parts = {}
+    for n in names:
+        k = cat.key(n)
+        parts.setdefault(shard_of(k, pool.n), set()).add(k)
+
+    started_at = datetime.now()
+    results, missing = pool.run(parts)
+    stale = {n for n in names if shard_of(cat.key(n), pool.n) in missing}
+    snapshot = merge_snapshots(market, names, results.values(), started_at, stale)
+    if not snapshot.items: return
+    if export_excel:
+        snapshot.export_excel_async()
+    return snapshot
@@ -0,0 +1,88 @@
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import metrics
+
+INDICATORS = ["最高", "最低", "均值", "中位数", "P10", "P90"]
+
+
+@dataclass
+class MarketSnapshot:
+    """
+    一个市场一轮抓取的结果，由 main_task() 直接交给 main_app.job。
+    stats: 饰品名 -> {"最高", "最低", "均值", "中位数", "P10", "P90", "数量"}；抓取失败为 None
+    ladders: 饰品名 -> 按价格升序的 orderbook.Ask 列表 (用于计算买 N 件的成本)
+    stale: 本轮没抓到 (熔断 / 失败) 的饰品名，计算时沿用价格库里的旧价
+    """
+    market: str          # "BUFF" / "YouPin"
+    file_prefix: str     # Excel 文件名前缀，如 "BUFF_数据"
+    items: list          # 任务顺序的饰品名
+    stats: dict
+    timestamp: datetime = field(default_factory=datetime.now)
+    ladders: dict = field(default_factory=dict)
+    stale: set = field(default_factory=set)
+
+    def to_frame(self):
+        """行为指标、列为饰品的表格 (与旧 Excel 布局一致)，缺失填 "-" """
+        import pandas as pd  # 只有导出 Excel 才用到，启动时不加载
+        data = {}
+        for skin in self.items:
+            s = self.stats.get(skin)
+            data[skin] = [s.get(k, "-") for k in INDICATORS] if s else ["-"] * len(INDICATORS)
+        return pd.DataFrame(data, index=INDICATORS)
+
+    def lowest(self):
+        """各饰品最低价 (float)，无数据或无在售记为 NaN"""
+        import pandas as pd
+        values = {}
+        for skin in self.items:
+            s = self.stats.get(skin)
+            values[skin] = s["最低"] if s and s.get("最低") else float("nan")
+        return pd.Series(values, dtype=float)
+
+    # ---------------- Excel 导出 (旁路输出) ----------------
+    @property
+    def excel_filename(self):
+        return f"{self.file_prefix}_{self.timestamp.strftime('%m%d(%H)')}.xlsx"
+
+    def export_excel(self, filename=None):
+        import pandas as pd
+        output_filename = filename or self.excel_filename
+        print(f"\n📊 正在生成: {output_filename}")
+        t0 = time.perf_counter()
+
+        try:
+            df = self.to_frame()
+
+            with pd.ExcelWriter(output_filename, engine='xlsxwriter') as writer:
+                df.to_excel(writer, sheet_name="统计数据")
+
+                workbook = writer.book
+                worksheet = writer.sheets["统计数据"]
+                yellow_fmt = workbook.add_format({'bg_color': '#FFFF00', 'bold': True})
+
+                # "最低" 在表头下第 2 行，整行标黄
+                target_row_idx = 2
+
+                for col_idx, col_name in enumerate(df.columns):
+                    val = df.loc["最低", col_name]
+                    worksheet.write(target_row_idx, col_idx + 1, val, yellow_fmt)
+
+                worksheet.write(target_row_idx, 0, "最低", yellow_fmt)
+
+            print(f"✅ Excel 生成完毕: {output_filename}")
+            metrics.observe("excel_write", time.perf_counter() - t0, market=self.market)
+
+        except Exception as e:
+            print(f"❌ Excel 生成失败: {e}")
+            traceback.print_exc()
+
+    def export_excel_async(self, filename=None):
+        """后台线程写 Excel，不阻塞计算与发信；返回线程对象"""
+        t = threading.Thread(target=self.export_excel, args=(filename,),
+                             name=f"excel-{self.market}")
+        t.start()
+        return t
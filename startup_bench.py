@@ -0,0 +1,109 @@
+"""
+启动耗时基准：反复冷启动主程序的 --startup-check 模式 (启动 -> 读配方 -> 退出，不抓取)，
+统计 "到第一行输出" 与 "进程退出" 两个耗时。打包后的 exe (PyInstaller -F 每次启动都要解压) 与源码都能测。
+
+用法:
+    python startup_bench.py                                 # 源码: python main_app.py
+    python startup_bench.py --exe dist/3_CS2_Monitor.exe    # 打包后的 exe
+    python startup_bench.py --imports                       # 额外列出最慢的导入 (python -X importtime)
+    python startup_bench.py --exe ... --max-seconds 8       # 中位数超过上限时返回 1 (CI 卡口用)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# ================= 配置区 =================
+RUNS = 5
+TIMEOUT = 120           # 单次启动超时 (秒)
+TOP_IMPORTS = 15
+# =========================================
+
+
+def run_once(cmd, cwd):
+    """返回 (到第一行输出的秒数, 退出的秒数, 输出)"""
+    env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    first = proc.stdout.readline()
+    t_first = time.perf_counter() - t0
+    # 不能用 communicate()：它直接读管道，readline 已缓冲的后续输出会丢
+    rest = proc.stdout.read()
+    proc.wait(timeout=TIMEOUT)
+    t_exit = time.perf_counter() - t0
+    output = (first + rest).decode("utf-8", "replace")
+    if proc.returncode != 0:
+        raise RuntimeError(f"退出码 {proc.returncode}:\n{output}")
+    return t_first, t_exit, output
+
+
+def summarize(values):
+    return {"min": min(values), "median": statistics.median(values), "max": max(values)}
+
+
+def slowest_imports(cwd, top=TOP_IMPORTS):
+    """python -X importtime 导入 main_app，按累计耗时排序"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main_app"],
+                          cwd=cwd, capture_output=True, text=True, timeout=TIMEOUT)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit(): continue  # 表头
+        rows.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主程序冷启动耗时基准")
+    parser.add_argument("--exe", help="打包后的可执行文件 (默认用当前 Python 跑 main_app.py)")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--cwd", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="运行目录 (需要有 task.xlsx)")
+    parser.add_argument("--imports", action="store_true", help="列出最慢的导入 (仅源码)")
+    parser.add_argument("--max-seconds", type=float, help="退出耗时中位数上限，超过返回 1")
+    parser.add_argument("--json", help="结果另存为 JSON")
+    args = parser.parse_args()
+
+    cmd = [os.path.abspath(args.exe)] if args.exe else [sys.executable, "main_app.py"]
+    cmd.append("--startup-check")
+    print(f"⏱️ 冷启动基准: {' '.join(cmd)}  x{args.runs}")
+
+    firsts, exits = [], []
+    for i in range(args.runs):
+        t_first, t_exit, output = run_once(cmd, args.cwd)
+        firsts.append(t_first)
+        exits.append(t_exit)
+        print(f"   第{i + 1}次: 首行输出 {t_first:.2f}s，退出 {t_exit:.2f}s")
+        if i == 0 and "启动检查通过" not in output:
+            print(f"⚠️ 输出里没有启动检查结果:\n{output}")
+
+    result = {"cmd": cmd, "runs": args.runs, "first_output": summarize(firsts), "exit": summarize(exits)}
+    print(f"\n{'指标':<12}{'最快':>8}{'中位数':>8}{'最慢':>8}")
+    for label, key in (("首行输出(s)", "first_output"), ("退出(s)", "exit")):
+        s = result[key]
+        print(f"{label:<12}{s['min']:>8.2f}{s['median']:>8.2f}{s['max']:>8.2f}")
+
+    if args.imports:
+        rows = slowest_imports(args.cwd)
+        result["imports"] = [{"module": n, "cumulative_ms": c / 1000, "self_ms": s / 1000} for c, s, n in rows]
+        print("\n最慢的导入 (累计 ms):")
+        for cumulative, self_us, name in rows:
+            print(f"   {cumulative / 1000:>8.1f}  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.max_seconds and result["exit"]["median"] > args.max_seconds:
+        print(f"❌ 启动中位数 {result['exit']['median']:.2f}s 超过上限 {args.max_seconds}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
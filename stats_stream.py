@@ -0,0 +1,161 @@
+import bisect
+import heapq
+import math
+
+from orderbook import make_ladder
+
+
+class P2Quantile:
+    """
+    分位数：前 EXACT_LIMIT 个样本保存在有序缓冲里精确计算 (单件饰品常见只有一两页挂单，P² 在这种样本量下偏差很大)；
+    超过后用缓冲初始化 P² 的 5 个标记点 (Jain & Chlamtac 1985)，之后 O(1) 内存与更新。
+    """
+
+    EXACT_LIMIT = 256
+
+    def __init__(self, p):
+        self.p = p
+        self.buffer = []   # 精确阶段的有序样本；切换到 P² 后为 None
+        self.q = []        # 标记点高度
+        self.n = []        # 标记点实际位置
+        self.np = []       # 标记点期望位置
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        if self.buffer is not None:
+            bisect.insort(self.buffer, x)
+            if len(self.buffer) > self.EXACT_LIMIT:
+                self._start_sketch()
+            return
+
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        # 调整中间三个标记点
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = self._parabolic(i, d)
+                q[i] = qp if q[i - 1] < qp < q[i + 1] else self._linear(i, d)
+                n[i] += d
+
+    def merge(self, other):
+        """并入另一个估计器的样本：精确阶段逐个并入；对方已是草图时按标记点间隔近似重放"""
+        if other.buffer is not None:
+            samples = other.buffer
+        else:
+            samples = [h for i in range(4) for h in [other.q[i]] * (other.n[i + 1] - other.n[i])]
+            samples.append(other.q[4])
+        for x in samples:
+            self.add(x)
+
+    def _start_sketch(self):
+        """由有序缓冲得到 5 个标记点：位置取期望位置的整数，高度取该位置的样本"""
+        buf, self.buffer = self.buffer, None
+        last = len(buf) - 1
+        self.np = [d * last for d in self.dn]
+        self.n = [int(round(x)) for x in self.np]
+        self.q = [buf[i] for i in self.n]
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def _linear(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        buf = self.buffer
+        if buf is not None:
+            if not buf: return None
+            # 精确取值 (与旧版 sorted(prices)[len // 2] 的取法一致)
+            return buf[min(int(self.p * len(buf)), len(buf) - 1)]
+        return self.q[2]
+
+
+class StreamingStats:
+    """
+    边收到挂单边更新的统计量：数量/最低/最高/均值 O(1)，
+    P10/中位数/P90 在样本少时精确计算，多了改用 P² 草图，内存有上限，不需要缓存和排序全部价格。
+    """
+
+    QUANTILES = {"P10": 0.1, "中位数": 0.5, "P90": 0.9}
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._sketches = {name: P2Quantile(p) for name, p in self.QUANTILES.items()}
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+        for s in self._sketches.values():
+            s.add(x)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_stats(self):
+        """报表用的统计字典；没有数据返回 None"""
+        if not self.count: return None
+        stats = {
+            "最高": self.max,
+            "最低": self.min,
+            "均值": round(self.mean, 2),
+        }
+        for name, s in self._sketches.items():
+            stats[name] = round(s.value(), 2)
+        stats["数量"] = self.count
+        return stats
+
+
+class ListingStream:
+    """
+    一件饰品的挂单流：统计量走 StreamingStats，
+    挂单深度只保留最便宜的 keep 件 (买 N 件只需要前 N 档)，用有界大顶堆维护。
+    """
+
+    def __init__(self, keep):
+        self.keep = max(1, keep)
+        self.stats = StreamingStats()
+        self._heap = []   # (-price, seq, ask)
+        self._seq = 0
+
+    def add(self, ask):
+        if not ask or not ask.price or ask.price <= 0: return
+        self.stats.add(ask.price)
+        self._seq += 1
+        entry = (-ask.price, self._seq, ask)
+        if len(self._heap) < self.keep:
+            heapq.heappush(self._heap, entry)
+        elif ask.price < -self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    @property
+    def units(self):
+        """已经看到的挂单数量 (决定何时停止翻页)"""
+        return self.stats.count
+
+    def ladder(self):
+        return make_ladder(e[2] for e in self._heap)
@@ -0,0 +1,53 @@
+"""
+stats_stream 的分位数与 sorted() 精确取值对照。
+    python -m pytest -q test_stats_stream.py    (或直接 python test_stats_stream.py)
+"""
+import random
+
+from stats_stream import P2Quantile, StreamingStats
+
+
+def exact(values, p):
+    """与 P2Quantile 精确阶段相同的取法：sorted(values)[int(p * n)]"""
+    s = sorted(values)
+    return s[min(int(p * len(s)), len(s) - 1)]
+
+
+def test_small_samples_are_exact():
+    rng = random.Random(1)
+    for n in (1, 2, 5, 6, 10, 37, P2Quantile.EXACT_LIMIT):
+        values = [round(rng.uniform(1, 500), 2) for _ in range(n)]
+        stats = StreamingStats()
+        for v in values:
+            stats.add(v)
+        result = stats.to_stats()
+        for name, p in StreamingStats.QUANTILES.items():
+            assert result[name] == round(exact(values, p), 2), (n, name)
+        assert result["最低"] == min(values) and result["最高"] == max(values)
+
+
+def test_one_page_of_listings():
+    # BUFF 只翻第 1 页时约 10 条挂单
+    stats = StreamingStats()
+    for v in range(1, 11):
+        stats.add(v)
+    result = stats.to_stats()
+    assert (result["P10"], result["中位数"], result["P90"]) == (2, 6, 10)
+
+
+def test_sketch_after_limit_stays_close():
+    rng = random.Random(2)
+    values = [rng.uniform(100, 200) for _ in range(5000)]
+    for p in (0.1, 0.5, 0.9):
+        q = P2Quantile(p)
+        for v in values:
+            q.add(v)
+        assert q.buffer is None
+        assert abs(q.value() - exact(values, p)) < 5, p
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"✅ {name}")
@@ -1,215 +1,415 @@
-import pandas as pd
-from playwright.sync_api import sync_playwright
+import asyncio
 import os
 import time
 import re
 from datetime import datetime
+from urllib.parse import urlparse
+
+import browser_service
+import catalog
+import metrics
+import net_filter
+import pipeline
+import recipes
+import rate_limiter
+import resilience
+import session_check
+from orderbook import Ask
+from stats_stream import ListingStream
+from snapshot import MarketSnapshot
 
 # ================= 配置区 =================
-INPUT_FILE = "task.xlsx"       
 COOKIE_FILE = "uu_auth.json"
+# 可用环境变量指向本地 fixture_server.py 做离线调试 / 基准测试
+YOUPIN_BASE_URL = os.environ.get("YOUPIN_BASE_URL", "https://www.youpin898.com")
+PAGE_POOL_SIZE = 3     # 并行标签页数量 (1 = 旧的串行模式)
+EXPORT_EXCEL = True    # 额外导出 UU_数据_*.xlsx (后台线程，不影响计算)
+CAPTURE_API = True     # 优先从页面自己请求的在售列表接口 (JSON) 取数据，拿不到再读表格
+# 站点自己的域名 (后缀匹配)：只有这些域名的 429 才算被限流，第三方统计 / CDN 的 429 不降速
+MARKET_HOSTS = ("youpin898.com", urlparse(YOUPIN_BASE_URL).hostname)
+# 在售列表接口地址中的特征片段 (站点改版时在这里补充)
+LISTING_API_PATTERNS = (
+    "/commodity/list/sell",
+    "queryOnSaleCommodityList",
+)
+PRICE_KEYS = ("price", "Price", "sellPrice", "SellPrice", "commodityPrice")
+WEAR_KEYS = ("abrade", "Abrade", "wear", "Wear", "paintwear")
+ID_KEYS = ("id", "Id", "commodityId", "CommodityId", "commodityNo", "orderNo")   # 挂单 ID，用于去重
 # =========================================
 
-def get_target_skins():
+# 商品页地址里的模板 ID，用来判断是否真的到了商品页
+DETAIL_ID_PATTERN = re.compile(r"templateId=(\d+)")
+# 行文本里的磨损值，如 "磨损：0.2345..."
+WEAR_PATTERN = re.compile(r"磨损[^\d]{0,3}(0\.\d+)")
+
+def get_target_skins(book=None):
     """
-    解析 task.xlsx
+    汇总所有配方 (task.xlsx / recipes.json) 用到的饰品
     返回列表结构: [{"name": "饰品名", "use_arrow": True/False}, ...]
     """
+    book = book or recipes.RecipeBook(recipes.load_recipes())
     targets = []
+    for t in book.targets():
+        if t["output"]:
+            # 产出：追加磨损后缀，并且需要下箭头选择
+            targets.append({"name": f"{t['raw']} ({t['wear']})", "use_arrow": True})
+        else:
+            # 材料：保持原样，不需要下箭头
+            targets.append({"name": t["raw"], "use_arrow": False})
+
+    print(f"📋 [任务加载] 共 {len(targets)} 个目标")
+    return targets
+
+# ============================================================
+# 👇 抓取函数
+# ============================================================
+# 一次 evaluate 取回所有可见行的文本，避免逐行 is_visible / inner_text 的往返
+ROWS_JS = """rows => rows
+    .filter(r => r.offsetParent !== null)
+    .map(r => r.innerText.replace(/\\n/g, ' '))"""
+
+def _first_number(d, keys):
+    for k in keys:
+        v = d.get(k)
+        if v in (None, ""): continue
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _listing_dicts(node):
+    """在任意结构的 JSON 里找挂单列表：元素都是字典且带价格字段的列表"""
+    if isinstance(node, list):
+        if node and all(isinstance(x, dict) for x in node) \
+                and any(_first_number(x, PRICE_KEYS) is not None for x in node):
+            yield from node
+            return
+        for x in node:
+            yield from _listing_dicts(x)
+    elif isinstance(node, dict):
+        for v in node.values():
+            yield from _listing_dicts(v)
+
+def _listing_id(d):
+    for k in ID_KEYS:
+        v = d.get(k)
+        if v not in (None, ""): return str(v)
+    return None
+
+def parse_listing_entries(data):
+    """在售列表接口的 JSON -> [(挂单 ID 或 None, Ask)]；结构不认识时返回空列表"""
+    entries = []
+    for d in _listing_dicts(data):
+        price = _first_number(d, PRICE_KEYS)
+        if price and price > 0:
+            entries.append((_listing_id(d), Ask(price, 1, _first_number(d, WEAR_KEYS), "YouPin")))
+    return entries
+
+def parse_listing_payload(data):
+    """在售列表接口的 JSON -> [Ask]"""
+    return [ask for _, ask in parse_listing_entries(data)]
+
+
+def is_market_url(url):
+    """站点自己的请求 (MARKET_HOSTS 下的域名，或匹配在售列表接口)"""
+    host = urlparse(url).hostname or ""
+    return any(host == h or host.endswith("." + h) for h in MARKET_HOSTS if h) \
+        or any(p in url for p in LISTING_API_PATTERNS)
+
+
+class ListingCapture:
+    """
+    挂在标签页上监听响应，收集匹配 LISTING_API_PATTERNS 的 JSON (与 BUFF 拦截 sell_order 同理)。
+    同一页的接口可能触发多次：每页 (地址 + 请求体) 只保留最后一次响应，各页之间再按挂单 ID 去重，
+    否则同一条挂单会被算两次 (统计偏移，买够 N 件的成本偏低)
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._pages = {}   # 请求标识 -> [(挂单 ID, Ask)]
+        page.on("response", self._on_response)
+
+    @property
+    def asks(self):
+        seen, asks = set(), []
+        for entries in self._pages.values():
+            for listing_id, ask in entries:
+                if listing_id is not None:
+                    if listing_id in seen: continue
+                    seen.add(listing_id)
+                asks.append(ask)
+        return asks
+
+    def clear(self):
+        self._pages.clear()
+
+    async def _on_response(self, response):
+        if response.status == 429:
+            if is_market_url(response.url):
+                rate_limiter.get_limiter("YouPin").penalize("HTTP 429")
+            return
+        if response.status != 200: return
+        if not any(p in response.url for p in LISTING_API_PATTERNS): return
+        if not DETAIL_ID_PATTERN.search(self.page.url): return  # 只收商品页的，市场页的搜索结果不算
+        try:
+            request = response.request
+            self._pages[(response.url, request.post_data)] = parse_listing_entries(await response.json())
+        except Exception:
+            pass  # 非 JSON / 页面已关闭，回退读表格
+
+    def detach(self):
+        self.page.remove_listener("response", self._on_response)
+
+
+async def scrape_sale_listings(page, depth, capture=None):
+    print("   📥 提取数据中...")
+    stream = ListingStream(depth)
+
+    # 1. 接口数据 (导航时已经截获)
+    asks = capture.asks if capture else None
+    if asks:
+        for ask in asks:
+            stream.add(ask)
+        print(f"   ⚡ 接口数据: {stream.units} 条")
+        metrics.inc("api_capture", market="YouPin")
+        return stream
+
+    # 2. 回退：一次性读出表格所有行
     try:
-        df = pd.read_excel(INPUT_FILE, header=None)
+        await page.wait_for_selector("tr.ant-table-row", timeout=3000)
+    except:
+        metrics.inc("timeout", market="YouPin", stage="table")
+
+    with metrics.timer("extraction", market="YouPin"):
+        texts = await page.eval_on_selector_all("tr.ant-table-row", ROWS_JS)
+    for full_text in dict.fromkeys(texts):  # 去重并保持顺序
+        p = re.search(r'[¥￥]\s*([\d\.]+)', full_text)
+        if not p: continue
+        try:
+            price = float(p.group(1))
+        except ValueError:
+            continue
+        w = WEAR_PATTERN.search(full_text)
+        stream.add(Ask(price, 1, float(w.group(1)) if w else None, "YouPin"))
+    return stream
+
+async def open_cached(page, url, tag):
+    """直接打开缓存的商品页；URL 被重定向或表格不出现视为缓存失效"""
+    await rate_limiter.get_limiter("YouPin").acquire_async()
+    browser_service.get_service().count_navigation("YouPin")
+    with metrics.timer("navigation", market="YouPin"):
+        await page.goto(url)
+
+    cached_id = DETAIL_ID_PATTERN.search(url)
+    now_id = DETAIL_ID_PATTERN.search(page.url)
+    if not now_id or now_id.group(1) != cached_id.group(1):
+        print(f"   ⚠️ {tag} 缓存页被重定向，重新搜索")
+        return False
+    timeout = resilience.get_guard("YouPin").timeout("table")
+    try:
+        t0 = time.perf_counter()
+        with metrics.timer("table_wait", market="YouPin"):
+            await page.wait_for_selector("tr.ant-table-row", timeout=timeout.ms)
+        timeout.observe(time.perf_counter() - t0)
+        return True
+    except:
+        print(f"   ⚠️ {tag} 缓存页无表格，重新搜索")
+        metrics.inc("timeout", market="YouPin", stage="cached_page")
+        return False
+
+async def search_item(page, skin_name, use_arrow, tag):
+    """在市场页搜索框中搜索，成功时返回 True"""
+    await rate_limiter.get_limiter("YouPin").acquire_async()
+    browser_service.get_service().count_navigation("YouPin")
+    await page.goto(f"{YOUPIN_BASE_URL}/market")
+    
+    guard = resilience.get_guard("YouPin")
+    # 交互逻辑
+    try:
+        t0 = time.perf_counter()
+        sb = await page.wait_for_selector("input.ant-input, input[class*='search']", state="visible",
+                                          timeout=guard.timeout("search").ms)
+        guard.timeout("search").observe(time.perf_counter() - t0)
+        await sb.click()
+        await sb.fill(skin_name) 
         
-        # 1. 第一行目标：追加 "(久经沙场)"，并且需要下箭头选择
-        row1_raw = df.iloc[0, 1:].dropna().astype(str).tolist()
-        for t in row1_raw:
-            clean_name = t.strip()
-            if clean_name:
-                targets.append({
-                    "name": f"{clean_name} (久经沙场)",
-                    "use_arrow": True  # 需要按箭头
-                })
+        await page.wait_for_timeout(500)  # 等联想词出现 (界面等待，不是请求节奏)
         
-        # 2. 后四个目标（第二列）：保持原样，不需要下箭头
-        col2_raw = df.iloc[2:6, 1].dropna().astype(str).tolist()
-        for t in col2_raw:
-            clean_name = t.strip()
-            if clean_name:
-                targets.append({
-                    "name": clean_name,
-                    "use_arrow": False # 不需要按箭头
-                })
+        # 关键修复：根据 use_arrow 决定是否按方向键
+        if use_arrow:
+            await sb.press("ArrowDown") # 选中第一个联想词
+            await page.wait_for_timeout(200)
         
-        print(f"📋 [任务加载] 共 {len(targets)} 个目标")
-        return targets
+        await sb.press("Enter")     # 跳转
+        
+        try:
+            t0 = time.perf_counter()
+            await page.wait_for_selector("tr.ant-table-row", timeout=guard.timeout("table").ms)
+            guard.timeout("table").observe(time.perf_counter() - t0)
+        except:
+            print(f"   ⚠️ {tag} 表格未加载")
+            metrics.inc("timeout", market="YouPin", stage="search")
+            return False
+
     except Exception as e:
-        print(f"❌ 读取 Excel 失败: {e}")
-        return []
+        print(f"   ❌ {tag} 交互失败: {e}")
+        return False
+    return True
 
-def run_scraper():
-    target_items = get_target_skins() # 获取带有配置的目标列表
-    if not target_items: return
+async def scrape_item(page, item_data, tag, db, depth):
+    """在一个标签页里完成单个饰品：(缓存直达 | 搜索) -> 等表格 -> 提取 -> 统计
+    返回 (stats, 按价格升序的挂单, 是否成功)；页面打不开 / 出错算失败，计入熔断"""
+    skin_name = item_data["name"]
+    use_arrow = item_data["use_arrow"]
+    guard = resilience.get_guard("YouPin")
 
-    file_timestamp = datetime.now().strftime('%m%d(%H)')
-    final_stats_map = {} 
+    print(f"\n{tag} 正在处理: {skin_name}")
 
-    with sync_playwright() as p:
-        print("🚀 [启动] V18 修复版：针对后四项移除多余下箭头操作")
+    capture = ListingCapture(page) if CAPTURE_API else None
+    try:
+        # 1. 有缓存直接打开商品页，失效则删掉缓存走搜索
+        loaded = False
+        cached_url = db.get(skin_name, "uu_url")
+        if cached_url:
+            loaded = await open_cached(page, cached_url, tag)
+            if not loaded:
+                db.drop(skin_name, "uu_url")
+                if capture: capture.clear()
+
+        if not loaded:
+            attempt = 0
+            while True:
+                with metrics.timer("search", market="YouPin"):
+                    found = await search_item(page, skin_name, use_arrow, tag)
+                if found or not await guard.retry_async(attempt):
+                    break
+                print(f"   🔁 {tag} 第 {attempt + 1} 次重试搜索")
+                attempt += 1
+                if capture: capture.clear()
+            if not found:
+                if rate_limiter.looks_like_captcha(page.url, await page.title()):
+                    rate_limiter.get_limiter("YouPin").penalize("验证码页")
+                guard.breaker.record_failure()
+                return None, [], False
+            # 搜索成功后记住商品页地址，下轮直达
+            if DETAIL_ID_PATTERN.search(page.url):
+                db.set(skin_name, "uu_url", page.url)
+                print(f"   💾 {tag} 已缓存商品页")
+
+        # 抓取
+        stream = await scrape_sale_listings(page, depth, capture)
         
-        #browser = p.chromium.launch(headless=False, args=["--disable-blink-features=AutomationControlled"])
-        # 修改点：加上 channel="msedge"，让它使用电脑自带的 Edge 浏览器
-        browser = p.chromium.launch(channel="msedge", headless=False, args=["--disable-blink-features=AutomationControlled"])
-        if os.path.exists(COOKIE_FILE):
-            context = browser.new_context(storage_state=COOKIE_FILE)
+        # 统计 (提取时已流式累计)
+        stats = stream.stats.to_stats()
+        guard.breaker.record_success()
+        rate_limiter.get_limiter("YouPin").reward()
+        if stats:
+            print(f"   ✅ {tag} 最低: {stats['最低']} | 均值: {stats['均值']}")
+            return stats, stream.ladder(), True
         else:
-            context = browser.new_context()
-            
-        page = context.new_page()
-        page.set_viewport_size({"width": 1920, "height": 1080})
-
-        # ⚡️ 拦截图片/字体，提升速度
-        page.route("**/*", lambda route: route.abort() 
-                   if route.request.resource_type in ["image", "media", "font"] 
-                   else route.continue_())
-
-        # ============================================================
-        # 👇 抓取函数
-        # ============================================================
-        def scrape_sale_prices():
-            print("   📥 提取数据中...")
-            # 无需滚动，直接等待表格
-            try:
-                page.wait_for_selector("tr.ant-table-row", timeout=3000)
-            except: pass
-
-            rows = page.locator("tr.ant-table-row").all()
-            prices = []
-            seen_hashes = set()
-
-            for row in rows:
-                try:
-                    if not row.is_visible(): continue
-                    full_text = row.inner_text().replace("\n", " ")
-                    
-                    h = hash(full_text)
-                    if h in seen_hashes: continue
-                    seen_hashes.add(h)
-
-                    if "¥" not in full_text and "￥" not in full_text: continue
-                    p = re.search(r'[¥￥]\s*([\d\.]+)', full_text)
-                    if p:
-                        prices.append(float(p.group(1)))
-                except: continue
-            return prices
-
-        # ============================================================
-        # 🔄 主循环
-        # ============================================================
-        for idx, item_data in enumerate(target_items):
-            skin_name = item_data["name"]
-            use_arrow = item_data["use_arrow"]
-            
-            print(f"\n[{idx+1}/{len(target_items)}] 正在处理: {skin_name}")
-            
-            try:
-                page.goto("https://www.youpin898.com/market")
-                
-                # 交互逻辑
+            print(f"   ⚠️ {tag} 无数据")
+            metrics.inc("empty", market="YouPin")
+            return None, [], True
+    
+    except Exception as e:
+        print(f"   ❌ {tag} 异常: {e}")
+        guard.breaker.record_failure()
+        return None, [], False
+    finally:
+        if capture: capture.detach()
+
+async def _setup_context(context):
+    # ⚡️ 请求路由：默认只拦图片 / 媒体 / 字体，strict 模式只放行页面、脚本和列表 / 搜索接口 (挂在 context 上，所有标签页共用，见 net_filter.py)
+    await net_filter.install(context, "YouPin", YOUPIN_BASE_URL, LISTING_API_PATTERNS)
+
+async def scrape_all(target_items, depth, pool_size=PAGE_POOL_SIZE):
+    """
+    常驻浏览器里的 YouPin context + N 个标签页，从共享队列里领取任务。
+    返回 ({饰品名: (stats, 挂单)}, 过期饰品集合)，顺序由调用方按任务列表重排。
+    熔断后各标签页不再打开页面，剩余饰品直接标为过期。
+    """
+    results = {}
+    stale = set()
+    guard = resilience.get_guard("YouPin")
+    db = catalog.get_catalog()
+    service = browser_service.get_service()
+
+    print(f"🚀 [启动] 标签页池模式：{pool_size} 个标签页并行")
+    context = await service.acquire("YouPin", COOKIE_FILE, setup=_setup_context,
+                                    viewport={"width": 1920, "height": 1080})
+
+    queue = asyncio.Queue()
+    for idx, item_data in enumerate(target_items):
+        queue.put_nowait((idx, item_data))
+
+    async def worker(wid):
+        page = await context.new_page()
+        try:
+            while True:
                 try:
-                    sb = page.wait_for_selector("input.ant-input, input[class*='search']", state="visible", timeout=10000)
-                    sb.click()
-                    sb.fill(skin_name) 
-                    
-                    page.wait_for_timeout(500) 
-                    
-                    # 关键修复：根据 use_arrow 决定是否按方向键
-                    if use_arrow:
-                        sb.press("ArrowDown") # 选中第一个联想词
-                        page.wait_for_timeout(200)
-                    
-                    sb.press("Enter")     # 跳转
-                    
-                    try:
-                        page.wait_for_selector("tr.ant-table-row", timeout=5000)
-                    except:
-                        print("   ⚠️ 表格未加载")
-                        final_stats_map[skin_name] = None
-                        continue
-
-                except Exception as e:
-                    print(f"   ❌ 交互失败: {e}")
-                    final_stats_map[skin_name] = None
+                    idx, item_data = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                tag = f"[Tab{wid} {idx+1}/{len(target_items)}]"
+                if not guard.breaker.allow():
+                    stale.add(item_data["name"])
                     continue
-
-                # 抓取
-                prices = scrape_sale_prices()
-                
-                # 统计
-                if prices:
-                    stats = {
-                        "最高": max(prices),
-                        "最低": min(prices),
-                        "均值": round(sum(prices) / len(prices), 2),
-                        "中位数": sorted(prices)[len(prices) // 2]
-                    }
-                    print(f"   ✅ 最低: {stats['最低']} | 均值: {stats['均值']}")
-                    final_stats_map[skin_name] = stats
+                with metrics.timer("item", market="YouPin"):
+                    stats, asks, ok = await scrape_item(page, item_data, tag, db, depth)
+                results[item_data["name"]] = (stats, asks)
+                if ok:
+                    pipeline.publish("YouPin", item_data["name"], stats or {}, asks)  # 立即交给流式计算 ({} = 无在售)
                 else:
-                    print("   ⚠️ 无数据")
-                    final_stats_map[skin_name] = None
-            
-            except Exception as e:
-                print(f"   ❌ 异常: {e}")
-                final_stats_map[skin_name] = None
+                    stale.add(item_data["name"])
+        finally:
+            await page.close()
 
-        browser.close()
+    n_workers = max(1, min(pool_size, len(target_items)))
+    await asyncio.gather(*(worker(i + 1) for i in range(n_workers)))
 
-    # ==========================================
-    # 💾 Excel 生成 (已修复重复行问题)
-    # ==========================================
-    output_filename = f"UU_数据_{file_timestamp}.xlsx"
-    print(f"\n📊 生成 Excel: {output_filename}")
+    if stale:
+        print(f"\n⚠️ {len(stale)} 件未抓到 (熔断 / 失败)，本轮沿用旧数据")
+        metrics.inc("stale", len(stale), market="YouPin")
+    return results, stale
 
-    try:
-        indicators = ["最高", "最低", "均值", "中位数"]
-        data_dict = {}
-        # 这里的循环也要改，从字典里取 name
-        for item in target_items:
-            skin = item["name"]
-            stats = final_stats_map.get(skin)
-            if stats:
-                data_dict[skin] = [stats[k] for k in indicators]
-            else:
-                data_dict[skin] = ["-", "-", "-", "-"]
-
-        df = pd.DataFrame(data_dict, index=indicators)
-
-        with pd.ExcelWriter(output_filename, engine='xlsxwriter') as writer:
-            # 1. 写入原始数据
-            df.to_excel(writer, sheet_name="统计数据")
-            
-            workbook = writer.book
-            worksheet = writer.sheets["统计数据"]
-            yellow_fmt = workbook.add_format({'bg_color': '#FFFF00', 'bold': True})
-            
-            # 2. 计算正确的行号
-            target_excel_row = 2 
-            
-            # 3. 遍历该行进行标黄
-            for col_idx in range(df.shape[1] + 1):
-                if col_idx == 0:
-                    worksheet.write(target_excel_row, col_idx, "最低", yellow_fmt)
-                else:
-                    val = df.iloc[1, col_idx - 1]
-                    worksheet.write(target_excel_row, col_idx, val, yellow_fmt)
+def run_scraper(only=None):
+    """only: 可选的规范键集合，只抓其中的饰品 (调度器按需抓取)"""
+    book = recipes.RecipeBook(recipes.load_recipes())
+    target_items = get_target_skins(book) # 获取带有配置的目标列表
+    if only is not None:
+        target_items = [t for t in target_items if catalog.get_catalog().key(t["name"]) in only]
+    if not target_items: return
+    if not session_check.preflight("YouPin"): return  # 登录失效：整个市场跳过，不逐件等超时
+    depth = book.max_input_count()  # 每件保留的挂单深度
 
-        print("🎉 全部完成！")
+    started_at = datetime.now()
 
-    except Exception as e:
-        print(f"❌ Excel 失败: {e}")
+    # 🔄 并行抓取，结果按 task.xlsx 中的顺序合并
+    resilience.get_guard("YouPin").new_cycle()
+    scraped, stale = browser_service.get_service().run(scrape_all(target_items, depth))
+    net_filter.cycle_report("YouPin", len(target_items))
+    final_stats_map = {}
+    final_ladders = {}
+    for item in target_items:
+        stats, asks = scraped.get(item["name"], (None, []))
+        final_stats_map[item["name"]] = stats
+        final_ladders[item["name"]] = asks
+
+    return MarketSnapshot("YouPin", "UU_数据", [item["name"] for item in target_items],
+                          final_stats_map, started_at, final_ladders, stale)
 
 # 封装供主程序调用
-def main_task():
-    run_scraper()
+def main_task(export_excel=EXPORT_EXCEL, only=None):
+    """返回 MarketSnapshot；Excel 在后台线程导出，不占主流程时间"""
+    snapshot = run_scraper(only)
+    if snapshot and export_excel:
+        snapshot.export_excel_async()
+    return snapshot
 
 if __name__ == "__main__":
-    main_task()
\ No newline at end of file
+    try:
+        snapshot = run_scraper()
+        if snapshot: snapshot.export_excel()
+    finally:
+        browser_service.shutdown()
\ No newline at end of file